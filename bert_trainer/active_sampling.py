@@ -1,16 +1,50 @@
+import numpy as np
 import pandas as pd
+import torch
 from sentence_transformers import SentenceTransformer, util
 from tqdm import tqdm
 
+from ann_index import normalized, normalized_blocks
+from configs import CENTROID, K_CENTER
+from embedding_cache import EmbeddingCache
+from profiling import span
+from unlabeled_pool import UnlabeledPool
+
 class active_sampling:
-    def __init__(self, model_name: str) -> None:
+    def __init__(self, model_name: str, cache_dir: str = None, cache_dtype: str = "float32") -> None:
         self.model = self.__set_embedding_model(model_name)
+        self.cache = EmbeddingCache(cache_dir, model_name, cache_dtype) if cache_dir is not None else None
 
     def __set_embedding_model(self, model_name: str):
         #if embedding_model_type == SBERT:
         model = SentenceTransformer(model_name)
         return model
 
+    def encode(self, sentences: list) -> torch.Tensor:
+        # the cache only encodes sentences never seen before with this model
+        with span("sbert_encoding", items=len(sentences), cached=self.cache is not None, profile_torch=True):
+            if self.cache is None:
+                return self.model.encode(sentences, convert_to_tensor=True)
+
+            return torch.from_numpy(self.cache.encode(self.model, sentences))
+
+    def embedding_rows(self, sentences: list):
+        """
+        :return tuple: array of embeddings and the row of each sentence in it (None when the rows are the sentences, in order).
+                       With the cache, the array is the memory-mapped store and nothing is loaded.
+        """
+        if self.cache is None:
+            return self.encode(sentences).cpu().numpy(), None
+
+        with span("sbert_encoding", items=len(sentences), cached=True):
+            rows = self.cache.rows(self.model, sentences)
+
+        return self.cache.store.data, rows
+
+    def cache_embeddings(self, sentences: list) -> None:
+        if self.cache is not None:
+            self.cache.update(self.model, sentences)
+
     def feasibilize(self, df: pd.DataFrame, percent_sampling: float, min_size: int) -> int:
         """
         :param df: DataFrame to sampling
@@ -29,15 +63,23 @@ class active_sampling:
         
         return int(percent_sampling*df_len)
 
-    def random(self, df_target: pd.DataFrame, seed: int, percent_sampling: float, min_size: int) -> pd.DataFrame:
+    def random(self, df_target, seed: int, percent_sampling: float, min_size: int) -> pd.DataFrame:
         """
-        :param df: DataFrame to sampling
+        :param df: DataFrame or UnlabeledPool to sampling
         :param seed: seed to the random set
         :param percent_sampling: percentage of data to sampling
         :param min_size: min size of the sample
         :return pd.DataFrame: DataFrame with the sampling
         """
         print("Random...")
+        if isinstance(df_target, UnlabeledPool):
+            if percent_sampling == 1:
+                return df_target.to_frame()
+
+            # draws from the available sentences without copying the pool
+            n_samples = self.feasibilize(df_target, percent_sampling, min_size)
+            return df_target.sample(n_samples, seed)
+
         if percent_sampling == 1:
             return df_target
 
@@ -48,7 +90,86 @@ class active_sampling:
 
         return df_sample
     
-    def dissimilarity(self, df_target: pd.DataFrame, df_to_sampling: pd.DataFrame, percent_sampling: float, min_size: int, input: str) -> pd.DataFrame:
+    def average_similarity(self, embeddings_sampling: torch.Tensor, embeddings_target: torch.Tensor, mode: str = CENTROID, chunk_size: int = 1024) -> np.ndarray:
+        """
+        :param embeddings_sampling: embeddings of the candidates (N x d)
+        :param embeddings_target: embeddings of the target set (M x d)
+        :param mode: CENTROID (exact, vectors are L2-normalized first) or CHUNKED (full matrix in blocks)
+        :param chunk_size: number of candidates per similarity block in CHUNKED mode
+        :return np.ndarray: mean cosine similarity of each candidate to the target set
+        """
+        if mode == CENTROID:
+            # mean_j(a . b_j) == a . mean_j(b_j) when every vector has unit norm
+            embeddings_sampling = torch.nn.functional.normalize(embeddings_sampling, dim=1)
+            embeddings_target = torch.nn.functional.normalize(embeddings_target, dim=1)
+            centroid = embeddings_target.mean(dim=0)
+
+            return (embeddings_sampling @ centroid).cpu().numpy()
+
+        # N x M similarity matrix, one block of candidates at a time
+        average_scores = []
+        for start in tqdm(range(0, len(embeddings_sampling), chunk_size)):
+            cosine_scores = util.cos_sim(embeddings_sampling[start:start + chunk_size], embeddings_target)
+            average_scores.append(cosine_scores.mean(dim=1).cpu().numpy())
+
+        return np.concatenate(average_scores) if average_scores else np.zeros(0)
+
+    def k_center(self, data_sampling: np.ndarray, data_target: np.ndarray, n_samples: int, rows_sampling: np.ndarray = None, rows_target: np.ndarray = None, chunk_size: int = 8192, top: int = 1024) -> np.ndarray:
+        """
+        Greedy k-center (farthest-first traversal) in cosine distance: every pick is the candidate
+        farthest from the target set and from the earlier picks.
+
+        :param data_sampling: embeddings of the candidates, possibly memory-mapped (rows_sampling selects the candidate rows)
+        :param data_target: embeddings of the target set, possibly memory-mapped (rows_target selects the target rows)
+        :param n_samples: number of candidates to pick
+        :param chunk_size: rows read at a time, memory is O(chunk_size x dim) besides one distance per candidate
+        :param top: candidates kept in memory between passes over data_sampling
+        :return np.ndarray: positions of the picked candidates, in pick order
+        """
+        n = len(data_sampling) if rows_sampling is None else len(rows_sampling)
+        n_samples = min(n_samples, n)
+
+        # distance of every candidate to its nearest target (or pick)
+        min_dist = np.full(n, np.inf, dtype=np.float32)
+        for start, block in normalized_blocks(data_sampling, rows_sampling, chunk_size):
+            for _, target in normalized_blocks(data_target, rows_target, chunk_size):
+                np.minimum(min_dist[start:start + len(block)], 1 - (block @ target.T).max(axis=1), out=min_dist[start:start + len(block)])
+
+        selected = []
+        while len(selected) < n_samples:
+            # the farthest candidates; none of the others can be picked before the distance of these falls below theirs
+            n_top = min(top, n - len(selected))
+            if n_top < n:
+                order = np.argpartition(-min_dist, n_top)
+                candidates, bound = order[:n_top], min_dist[order[n_top]]
+            else:
+                candidates, bound = np.arange(n), -np.inf
+
+            positions = candidates if rows_sampling is None else rows_sampling[candidates]
+            vectors = normalized(data_sampling, positions)
+            distances = min_dist[candidates].copy()
+
+            # exact greedy picks among the candidates in memory, while the farthest of them is still beyond the bound
+            picked = []
+            while len(selected) < n_samples:
+                best = int(np.argmax(distances))
+                if distances[best] < bound or distances[best] == -np.inf:
+                    break
+
+                picked.append(best)
+                selected.append(int(candidates[best]))
+                np.minimum(distances, 1 - vectors @ vectors[best], out=distances)
+                distances[best] = -np.inf
+
+            # one pass over all the candidates for the distances to the new picks
+            centers = vectors[picked]
+            for start, block in normalized_blocks(data_sampling, rows_sampling, chunk_size):
+                np.minimum(min_dist[start:start + len(block)], 1 - (block @ centers.T).max(axis=1), out=min_dist[start:start + len(block)])
+            min_dist[selected] = -np.inf
+
+        return np.asarray(selected, dtype=np.int64)
+
+    def dissimilarity(self, df_target: pd.DataFrame, df_to_sampling: pd.DataFrame, percent_sampling: float, min_size: int, input: str, mode: str = CENTROID) -> pd.DataFrame:
         if self.model is None:
             return pd.DataFrame()
         
@@ -62,18 +183,27 @@ class active_sampling:
         target_sentences = df_target[input].tolist()
         sampling_sentences = df_to_sampling[input].tolist()
 
-        # Compute embeddings
-        embeddings_target = self.model.encode(target_sentences, convert_to_tensor=True)
-        embeddings_sampling = self.model.encode(sampling_sentences, convert_to_tensor=True)
+        if mode == K_CENTER:
+            # diverse batch: farthest-first from the labeled set, chunked over the (memory-mapped) embeddings
+            data_target, rows_target = self.embedding_rows(target_sentences)
+            data_sampling, rows_sampling = self.embedding_rows(sampling_sentences)
+            n_samples = self.feasibilize(df_target, percent_sampling, min_size)
 
-        # Compute cosine-similarities for each sentence in df_to_sampling with all sentences in df_target
-        cosine_scores = util.cos_sim(embeddings_sampling, embeddings_target)
+            with span("k_center", items=len(sampling_sentences), targets=len(target_sentences), picks=n_samples):
+                selected_indices = self.k_center(data_sampling, data_target, n_samples, rows_sampling, rows_target)
 
-        # Calculate the average cosine similarity for each sentence in df_to_sampling
-        average_scores = [sum(cosine_scores[i]) / len(cosine_scores[i]) for _, i in enumerate(tqdm(range(len(cosine_scores))))]
+            return df_to_sampling.iloc[selected_indices].reset_index(drop=True)
+
+        # Compute embeddings
+        embeddings_target = self.encode(target_sentences)
+        embeddings_sampling = self.encode(sampling_sentences)
+
+        # Average cosine similarity of each sentence in df_to_sampling with all sentences in df_target
+        with span("cosine_scoring", items=len(sampling_sentences), targets=len(target_sentences), mode=mode):
+            average_scores = self.average_similarity(embeddings_sampling, embeddings_target, mode)
 
         # Sort sentences in df_to_sampling by decreasing average similarity score
-        sorted_indices = sorted(range(len(average_scores)), key=lambda i: average_scores[i])
+        sorted_indices = np.argsort(average_scores, kind="stable")
 
         n_samples = self.feasibilize(df_target, percent_sampling, min_size)
 
@@ -86,8 +216,26 @@ class active_sampling:
 
         return df_sample
     
-    def random_dissimilarity(self, df_target: pd.DataFrame, df_to_sampling: pd.DataFrame, input: str, seed: int, percent_sampling_random: float, percent_sampling_dissimilar: float, min_size_random: int, min_size_dissimilar: int):
+    def index_dissimilarity(self, index, df_target: pd.DataFrame, df_to_sampling: UnlabeledPool, percent_sampling_random: float, percent_sampling_dissimilar: float, min_size_random: int, min_size_dissimilar: int) -> pd.DataFrame:
+        """
+        Sample of the size random_dissimilarity would draw, the least similar to df_target in the whole pool
+        according to the ANN index (IVFIndex) instead of a random prefilter.
+
+        :param index: IVFIndex of the pool embeddings, its labeled set kept in sync with df_target and
+            the sentences sampled before marked as attempted (a retry draws the next least similar ones)
+        """
+        n_samples = self.feasibilize(df_to_sampling, percent_sampling_random, min_size_random)
+        if percent_sampling_dissimilar != 1:
+            n_samples = min(n_samples, self.feasibilize(df_target, percent_sampling_dissimilar, min_size_dissimilar))
+
+        print("Index dissimilarity...")
+        with span("index_dissimilarity", items=n_samples):
+            ids, _ = index.least_similar(n_samples)
+
+        return df_to_sampling.frame(df_to_sampling.positions(ids))
+
+    def random_dissimilarity(self, df_target: pd.DataFrame, df_to_sampling, input: str, seed: int, percent_sampling_random: float, percent_sampling_dissimilar: float, min_size_random: int, min_size_dissimilar: int, mode: str = CENTROID):
         random = self.random(df_to_sampling, seed, percent_sampling_random, min_size_random)
-        dissimilar = self.dissimilarity(df_target, random, percent_sampling_dissimilar, min_size_dissimilar, input)
+        dissimilar = self.dissimilarity(df_target, random, percent_sampling_dissimilar, min_size_dissimilar, input, mode)
 
         return dissimilar
@@ -0,0 +1,367 @@
+import hashlib
+import json
+import os
+from os import path
+
+import numpy as np
+
+
+def normalized_blocks(data: np.ndarray, rows: np.ndarray = None, chunk_size: int = 8192):
+    """
+    :param data: embeddings, possibly memory-mapped
+    :param rows: rows of data to read (None for all of them, in order)
+    :yield tuple: start position and L2-normalized float32 block of chunk_size rows
+    """
+    n = len(data) if rows is None else len(rows)
+    for start in range(0, n, chunk_size):
+        block = data[start:start + chunk_size] if rows is None else data[rows[start:start + chunk_size]]
+        block = np.asarray(block, dtype=np.float32)
+        yield start, block / np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+
+
+def ids_hash(ids) -> str:
+    """
+    :return str: sha1 of the set of ids (their order does not matter)
+    """
+    return hashlib.sha1(np.sort(np.asarray(ids, dtype=np.int64)).tobytes()).hexdigest()
+
+
+def normalized(data: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+    n = len(data) if rows is None else len(rows)
+    if n == 0:
+        return np.zeros((0, data.shape[1]), dtype=np.float32)
+
+    return next(normalized_blocks(data, rows, n))[1]
+
+
+class IVFIndex:
+    """
+    Inverted-file index of unit-normalized sentence embeddings (cosine
+    similarity), with spherical k-means cells. Queries only read the
+    sentences of the cells nearest to them.
+
+    root/meta.json         -> {"dim", "nlist", "n", "model", "ids_sha1"}
+    root/centroids.npy     -> nlist x dim centroids
+    root/vectors.f32       -> normalized embeddings of the indexed sentences (append-only)
+    root/ids.i64           -> id of every indexed sentence (append-only)
+    root/cells.i32         -> cell of every indexed sentence (append-only)
+
+    n in meta.json is written last, rows past it (an interrupted append) are ignored.
+
+    The labeled set of a run (which indexed sentences are labeled, the
+    reference embeddings from outside the index and the coverage of the
+    cells) and the sentences already offered to it (attempted) are kept in
+    memory, several runs can share the files.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.meta_path = f"{root}/meta.json"
+        self.meta = None
+        self.labeled = None
+        self.attempted = None
+
+        if path.exists(self.meta_path):
+            self._load()
+
+    @property
+    def exists(self) -> bool:
+        return self.meta is not None
+
+    def __len__(self) -> int:
+        return self.meta["n"] if self.exists else 0
+
+    def matches(self, model: str, ids) -> bool:
+        """
+        :return bool: True if the index holds the embeddings of model for exactly these ids
+        """
+        return self.exists and self.meta.get("model") == model and self.meta.get("ids_sha1") == ids_hash(ids)
+
+    def _write_meta(self) -> None:
+        with open(f"{self.meta_path}.{os.getpid()}.tmp", "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(f"{self.meta_path}.{os.getpid()}.tmp", self.meta_path)
+
+    def _memmap(self, file_name: str, dtype, shape):
+        if shape[0] == 0:
+            return np.zeros(shape, dtype=dtype)
+
+        return np.memmap(f"{self.root}/{file_name}", dtype=dtype, mode="r", shape=shape)
+
+    def _load(self) -> None:
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        n, dim = self.meta["n"], self.meta["dim"]
+        self.centroids = np.load(f"{self.root}/centroids.npy")
+        self.vectors = self._memmap("vectors.f32", np.float32, (n, dim))
+        self.ids = np.asarray(self._memmap("ids.i64", np.int64, (n,)))
+        self.cells = np.asarray(self._memmap("cells.i32", np.int32, (n,)))
+
+        # ids are looked up by binary search, the sentences of a cell are a slice of cell_order
+        self.id_order = np.argsort(self.ids, kind="stable")
+        self.cell_order = np.argsort(self.cells, kind="stable")
+        self.cell_starts = np.searchsorted(self.cells[self.cell_order], np.arange(self.meta["nlist"] + 1))
+
+        # cells probed around every cell
+        self.neighbours = None
+
+        if self.labeled is None:
+            self.reset()
+        else:
+            # sentences added since the last load are unlabeled and never attempted
+            self.labeled = np.concatenate([self.labeled, np.zeros(n - len(self.labeled), dtype=bool)])
+            self.attempted = np.concatenate([self.attempted, np.zeros(n - len(self.attempted), dtype=bool)])
+
+    def _set_reference(self, vectors: np.ndarray) -> None:
+        self.reference = vectors
+        self.reference_cells = self._assign(vectors)
+        self.reference_order = np.argsort(self.reference_cells, kind="stable")
+        self.reference_starts = np.searchsorted(self.reference_cells[self.reference_order], np.arange(self.meta["nlist"] + 1))
+
+    def _assign(self, block: np.ndarray) -> np.ndarray:
+        return np.argmax(block @ self.centroids.T, axis=1).astype(np.int32)
+
+    @classmethod
+    def build(cls, root: str, data: np.ndarray, rows: np.ndarray = None, ids: np.ndarray = None, nlist: int = None, iterations: int = 10, sample_size: int = None, seed: int = 42, chunk_size: int = 8192, model: str = None):
+        """
+        :param root: directory of the index (replaced)
+        :param data: embeddings, possibly memory-mapped (e.g. an EmbeddingCache store)
+        :param rows: rows of data to index (None for all of them)
+        :param ids: id of every indexed row (default: its position)
+        :param nlist: number of cells (default: 4 sqrt(n))
+        :param sample_size: embeddings the centroids are trained on (default: 64 per cell)
+        :param model: name of the embedding model, checked by matches()
+        :return IVFIndex: the new index
+        """
+        n = len(data) if rows is None else len(rows)
+        ids = np.arange(n, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+        nlist = max(1, min(n, nlist if nlist is not None else int(4 * np.sqrt(n))))
+        sample_size = min(n, sample_size if sample_size is not None else 64 * nlist)
+
+        # spherical k-means on a sample, the centroids start as random sample members
+        rng = np.random.default_rng(seed)
+        sample_positions = np.sort(rng.choice(n, size=sample_size, replace=False))
+        sample = normalized(data, sample_positions if rows is None else rows[sample_positions])
+        centroids = sample[rng.choice(sample_size, size=nlist, replace=False)]
+
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            counts = np.bincount(assignment, minlength=nlist)
+
+            # sum of the members of every cell, from the sample sorted by cell
+            sums = np.zeros_like(centroids)
+            starts = np.cumsum(counts) - counts
+            sums[counts > 0] = np.add.reduceat(sample[np.argsort(assignment, kind="stable")], starts[counts > 0], axis=0)
+
+            # an empty cell starts over from a random sample member
+            empty = np.flatnonzero(counts == 0)
+            sums[empty] = sample[rng.choice(sample_size, size=len(empty))]
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+        os.makedirs(root, exist_ok=True)
+        for file_name in ["meta.json", "vectors.f32", "ids.i64", "cells.i32"]:
+            if path.exists(f"{root}/{file_name}"):
+                os.remove(f"{root}/{file_name}")
+
+        np.save(f"{root}/centroids.npy", centroids.astype(np.float32))
+
+        index = cls(root)
+        index.meta = {"dim": int(centroids.shape[1]), "nlist": nlist, "n": 0, "model": model, "ids_sha1": ids_hash([])}
+        index.centroids = centroids.astype(np.float32)
+        index._write_meta()
+        index._load()
+        index.add(data, rows, ids, chunk_size)
+
+        return index
+
+    def _append(self, blocks, meta: dict) -> None:
+        """
+        :param blocks: iterable of {file name: rows} dicts, the same number of rows for every file
+        :param meta: fields of meta.json updated with the new row count
+        """
+        files = {}
+        n_new = 0
+
+        try:
+            for arrays in blocks:
+                for file_name, array in arrays.items():
+                    if file_name not in files:
+                        # cut back to the rows of meta.json first (leftovers of an interrupted append)
+                        files[file_name] = open(f"{self.root}/{file_name}", "ab")
+                        files[file_name].truncate(self.meta["n"] * array.itemsize * (array.shape[1] if array.ndim > 1 else 1))
+                    files[file_name].write(np.ascontiguousarray(array).tobytes())
+
+                n_new += len(next(iter(arrays.values())))
+        finally:
+            for f_out in files.values():
+                f_out.close()
+
+        self.meta.update(meta)
+        self.meta["n"] += n_new
+        self._write_meta()
+        self._load()
+
+    def add(self, data: np.ndarray, rows: np.ndarray = None, ids: np.ndarray = None, chunk_size: int = 8192) -> None:
+        """
+        Adds unlabeled sentences to their nearest cells (the centroids are not retrained).
+        """
+        n = len(data) if rows is None else len(rows)
+        ids = np.arange(len(self), len(self) + n, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+
+        self._append(({
+            "vectors.f32": block,
+            "ids.i64": ids[start:start + len(block)],
+            "cells.i32": self._assign(block),
+        } for start, block in normalized_blocks(data, rows, chunk_size)), {"ids_sha1": ids_hash(np.concatenate([self.ids, ids]))})
+
+    def _update_coverage(self, vectors: np.ndarray) -> None:
+        if len(vectors) > 0:
+            np.maximum(self.coverage, (vectors @ self.centroids.T).max(axis=0), out=self.coverage)
+
+    def reset(self, reference: np.ndarray = None, reference_rows: np.ndarray = None) -> None:
+        """
+        Starts a run over: every indexed sentence is unlabeled (and not attempted) again and the labeled set is reference.
+
+        :param reference: embeddings of the labeled sentences outside the index, possibly memory-mapped
+        :param reference_rows: rows of reference to use (None for all of them)
+        """
+        self.labeled = np.zeros(self.meta["n"], dtype=bool)
+        self.attempted = np.zeros(self.meta["n"], dtype=bool)
+
+        vectors = normalized(reference, reference_rows) if reference is not None else np.zeros((0, self.meta["dim"]), dtype=np.float32)
+        self._set_reference(vectors)
+
+        self.coverage = np.full(self.meta["nlist"], -np.inf, dtype=np.float32)
+        self._update_coverage(vectors)
+
+    def positions(self, ids) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        sorted_ids = self.ids[self.id_order]
+        idx = np.searchsorted(sorted_ids, ids)
+
+        # unknown ids are ignored
+        found = (idx < len(sorted_ids)) & (sorted_ids[np.minimum(idx, len(sorted_ids) - 1)] == ids)
+
+        return self.id_order[idx[found]]
+
+    def mark_labeled(self, ids) -> None:
+        """
+        Moves sentences from the unlabeled to the labeled set, the coverage of the cells is updated with them.
+        """
+        positions = np.unique(self.positions(ids))
+        self.labeled[positions] = True
+
+        self._update_coverage(np.asarray(self.vectors[positions]))
+
+    def mark_attempted(self, ids) -> None:
+        """
+        Sentences already offered by least_similar (e.g. rejected by the labeling threshold), never offered again in the run.
+        """
+        self.attempted[self.positions(ids)] = True
+
+    def _neighbours(self, nprobe: int) -> np.ndarray:
+        # the nprobe cells nearest to every cell (itself first)
+        nprobe = min(nprobe, self.meta["nlist"])
+        if self.neighbours is None or self.neighbours.shape[1] != nprobe:
+            self.neighbours = np.argsort(-(self.centroids @ self.centroids.T), axis=1, kind="stable")[:, :nprobe]
+
+        return self.neighbours
+
+    def _members(self, cells, labeled: bool = None) -> np.ndarray:
+        """
+        :param labeled: True/False for only the labeled/unlabeled sentences, None for all
+        :return np.ndarray: positions of the indexed sentences of the cells
+        """
+        positions = [self.cell_order[self.cell_starts[cell]:self.cell_starts[cell + 1]] for cell in np.atleast_1d(cells)]
+        positions = np.concatenate(positions) if positions else np.zeros(0, dtype=np.int64)
+
+        if labeled is not None:
+            positions = positions[self.labeled[positions] == labeled]
+
+        return positions
+
+    def _labeled_vectors(self, cells) -> np.ndarray:
+        # labeled sentences of the index and reference embeddings of the cells
+        reference = [self.reference_order[self.reference_starts[cell]:self.reference_starts[cell + 1]] for cell in np.atleast_1d(cells)]
+        reference = self.reference[np.concatenate(reference)] if reference else np.zeros((0, self.meta["dim"]), dtype=np.float32)
+
+        return np.concatenate([np.asarray(self.vectors[np.sort(self._members(cells, labeled=True))]), reference])
+
+    def search(self, queries: np.ndarray, k: int = 10, nprobe: int = 8, only_unlabeled: bool = True):
+        """
+        :param queries: query embeddings (q x dim)
+        :return tuple: ids and cosine similarities of the k nearest indexed sentences of every query (lists, most similar first)
+        """
+        queries = normalized(np.atleast_2d(queries))
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :min(nprobe, self.meta["nlist"])]
+
+        ids, similarities = [], []
+        for query, cells in zip(queries, probes):
+            positions = np.sort(self._members(cells, labeled=False if only_unlabeled else None))
+            scores = np.asarray(self.vectors[positions]) @ query
+            best = np.argsort(-scores, kind="stable")[:k]
+
+            ids.append(self.ids[positions[best]])
+            similarities.append(scores[best])
+
+        return ids, similarities
+
+    def near_duplicates(self, queries: np.ndarray, threshold: float = 0.95, nprobe: int = 4, only_unlabeled: bool = True) -> list:
+        """
+        :return list: ids of the indexed sentences with a cosine similarity of at least threshold to every query
+        """
+        queries = normalized(np.atleast_2d(queries))
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :min(nprobe, self.meta["nlist"])]
+
+        result = []
+        for query, cells in zip(queries, probes):
+            positions = np.sort(self._members(cells, labeled=False if only_unlabeled else None))
+            scores = np.asarray(self.vectors[positions]) @ query
+            result.append(self.ids[positions[scores >= threshold]])
+
+        return result
+
+    def least_similar(self, n: int, nprobe: int = 8, oversample: float = 2.0):
+        """
+        Unlabeled sentences least similar to the labeled set, leaving out the attempted ones. The cells
+        farthest from the labeled set (lowest coverage) are read first, and every sentence read is
+        scored against the labeled sentences of the nprobe cells around its own.
+
+        :param n: number of sentences
+        :param oversample: sentences read per sentence returned
+        :return tuple: ids and approximate highest similarity to the labeled set, least similar first
+        """
+        wanted = int(np.ceil(oversample * n))
+        neighbours = self._neighbours(nprobe)
+
+        positions, scores = [], []
+        read = 0
+        for cell in np.argsort(self.coverage, kind="stable"):
+            members = self._members(cell, labeled=False)
+            members = np.sort(members[~self.attempted[members]])
+            if len(members) == 0:
+                continue
+
+            labeled = self._labeled_vectors(neighbours[cell])
+            if len(labeled) > 0:
+                cell_scores = (np.asarray(self.vectors[members]) @ labeled.T).max(axis=1)
+            else:
+                # no labeled sentence nearby: the cell's coverage bounds how close the labeled set comes
+                cell_scores = np.full(len(members), self.coverage[cell], dtype=np.float32)
+
+            positions.append(members)
+            scores.append(cell_scores)
+            read += len(members)
+
+            if read >= wanted:
+                break
+
+        if not positions:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        positions = np.concatenate(positions)
+        scores = np.concatenate(scores)
+        order = np.argsort(scores, kind="stable")[:n]
+
+        return self.ids[positions[order]], scores[order]
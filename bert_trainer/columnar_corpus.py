@@ -0,0 +1,127 @@
+import json
+import os
+from os import path
+
+import numpy as np
+import pandas as pd
+
+
+class ColumnarCorpus:
+    """
+    Memory-mappable copy of an unlabeled JSON corpus, converted once and
+    shared (page cache) by every process reading it. Every column is stored as
+
+    {column}.bytes       -> UTF-8 text of all the rows, concatenated
+    {column}.offsets.npy -> start of every row in the bytes (plus the end of the last one)
+    {column}.nulls.npy   -> True for the rows without a value
+
+    next to num_tokens.npy (whitespace tokens of the text column) and a
+    manifest with the size and modification time of the source file.
+    Columns holding anything but text (numbers, lists, ...) are stored as
+    the JSON of each value, so frame() gives back the types of the source
+    file. The id of a row is its position in the JSON file.
+    """
+
+    def __init__(self, source: str, root: str = None, text_column: str = "sentences") -> None:
+        self.source = source
+        self.root = root if root is not None else f"{source}.columnar"
+        self.text_column = text_column
+
+        stat = os.stat(source)
+        self.signature = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+        self.manifest = self._load_manifest()
+        # manifests without json_columns come from a version that stored every value as its str()
+        if self.manifest is None or self.manifest["source"] != self.signature or self.manifest["text_column"] != text_column or "json_columns" not in self.manifest:
+            self.convert()
+            self.manifest = self._load_manifest()
+
+        self.columns = self.manifest["columns"]
+        self.json_columns = set(self.manifest["json_columns"])
+        self.num_tokens = np.load(f"{self.root}/num_tokens.npy", mmap_mode="r")
+        self._data = {}
+        self._offsets = {}
+        self._nulls = {}
+
+    def _load_manifest(self):
+        manifest_path = f"{self.root}/manifest.json"
+
+        if not path.exists(manifest_path):
+            return None
+
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _replace(self, file_name: str, write) -> None:
+        # every process converting at the same time writes the same content, the last rename wins
+        tmp = f"{self.root}/{file_name}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f_out:
+            write(f_out)
+        os.replace(tmp, f"{self.root}/{file_name}")
+
+    def convert(self) -> None:
+        print("Converting:", self.source)
+        os.makedirs(self.root, exist_ok=True)
+
+        with open(self.source, "r") as f:
+            df = pd.DataFrame(json.load(f))
+
+        json_columns = []
+
+        for column in df.columns:
+            values = df[column].tolist()
+            nulls = np.asarray([value is None or (isinstance(value, float) and np.isnan(value)) for value in values], dtype=bool)
+
+            # text stays raw UTF-8, other values keep their type through JSON
+            if all(isinstance(value, str) for value, null in zip(values, nulls) if not null):
+                encoded = [b"" if null else value.encode("utf-8") for value, null in zip(values, nulls)]
+            else:
+                json_columns.append(str(column))
+                encoded = [b"" if null else json.dumps(value, ensure_ascii=False).encode("utf-8") for value, null in zip(values, nulls)]
+
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in encoded], out=offsets[1:])
+
+            self._replace(f"{column}.bytes", lambda f_out: f_out.writelines(encoded))
+            self._replace(f"{column}.offsets.npy", lambda f_out: np.save(f_out, offsets))
+            self._replace(f"{column}.nulls.npy", lambda f_out: np.save(f_out, nulls))
+
+        num_tokens = np.asarray([len(text.split()) if isinstance(text, str) else 0 for text in df[self.text_column]], dtype=np.int32)
+        self._replace("num_tokens.npy", lambda f_out: np.save(f_out, num_tokens))
+
+        # the manifest is written last, it marks the conversion as complete
+        manifest = {"source": self.signature, "text_column": self.text_column, "columns": [str(column) for column in df.columns], "json_columns": json_columns, "rows": len(df)}
+        self._replace("manifest.json", lambda f_out: f_out.write(json.dumps(manifest).encode("utf-8")))
+
+    def __len__(self) -> int:
+        return self.manifest["rows"]
+
+    def _column(self, column: str):
+        if column not in self._data:
+            offsets = np.load(f"{self.root}/{column}.offsets.npy", mmap_mode="r")
+            # np.memmap refuses empty files
+            self._data[column] = np.memmap(f"{self.root}/{column}.bytes", dtype=np.uint8, mode="r") if offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+            self._offsets[column] = offsets
+            self._nulls[column] = np.load(f"{self.root}/{column}.nulls.npy", mmap_mode="r")
+
+        return self._data[column], self._offsets[column], self._nulls[column]
+
+    def values(self, column: str, rows) -> list:
+        """
+        :return list: value of the column for each row (None where the source has none)
+        """
+        data, offsets, nulls = self._column(column)
+        values = [None if nulls[row] else data[offsets[row]:offsets[row + 1]].tobytes().decode("utf-8") for row in rows]
+
+        if column in self.json_columns:
+            return [None if value is None else json.loads(value) for value in values]
+
+        return values
+
+    def frame(self, rows) -> pd.DataFrame:
+        rows = np.asarray(rows, dtype=np.int64)
+
+        df = pd.DataFrame({column: self.values(column, rows) for column in self.columns})
+        df["id"] = rows
+
+        return df
@@ -9,6 +9,14 @@ TERM_THRESHOLD = "term"
 
 SBERT = "sbert"
 
+#Dissimilarity scoring
+CENTROID = "centroid"
+CHUNKED = "chunked"
+K_CENTER = "k_center"
+
+#Warm start (training set of an iteration that continues from the previous model)
+WARM_START_TRAIN_FILE = "train_warm_start.txt"
+
 #Threshold
 HISTOGRAM = 'histogram'
 LINEAR = 'linear'
@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+from os import path
+
+import pandas as pd
+
+
+def write_conll(df: pd.DataFrame, file_path: str) -> None:
+    """
+    :param df: DataFrame with the tokens and ner_tokens of every sentence
+    :param file_path: CoNLL file (token tag per line, blank line between sentences)
+    """
+    with open(file_path, "w", encoding="utf-8") as f_out:
+        for tokens, tags in zip(df["tokens"], df["ner_tokens"]):
+            f_out.write("".join("{} {}\n".format(txt, tag) for txt, tag in zip(tokens, tags)))
+            f_out.write("\n")
+
+
+class CorpusStore:
+    """
+    Append-only labeled corpus of a self-learning run. Every batch of
+    sentences is written once, as a segment
+
+    root/{segment}.txt   -> CoNLL (token tag per line, blank line between sentences)
+    root/{segment}.jsonl -> one JSON record per sentence
+
+    and root/manifest.json lists the segments in order (segment 0 is the
+    original labeled corpus). train.txt is the concatenation of the
+    segments' .txt files.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+        self.manifest_path = f"{root}/manifest.json"
+        self.segments = []
+
+        if path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.segments = json.load(f)["segments"]
+
+        # dest file -> number of segments it holds
+        self._assembled = {}
+
+    def _save_manifest(self, file_path: str) -> None:
+        with open(f"{file_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"root": self.root, "segments": self.segments}, f, indent=2)
+
+        os.replace(f"{file_path}.tmp", file_path)
+
+    def _write_segment(self, df: pd.DataFrame, iteration) -> None:
+        name = "{segment:04d}".format(segment=len(self.segments))
+        txt_path = f"{self.root}/{name}.txt"
+
+        write_conll(df, txt_path)
+
+        df.to_json(f"{self.root}/{name}.jsonl", orient="records", lines=True, force_ascii=False)
+
+        self.segments.append({
+            "segment": len(self.segments),
+            "iteration": iteration,
+            "sentences": len(df),
+            "txt": f"{name}.txt",
+            "jsonl": f"{name}.jsonl",
+            "bytes": os.path.getsize(txt_path),
+        })
+        self._save_manifest(self.manifest_path)
+
+    def reset(self, df: pd.DataFrame) -> None:
+        """
+        Starts the store over with df as segment 0.
+        """
+        for segment in self.segments:
+            for file_name in [segment["txt"], segment["jsonl"]]:
+                if path.exists(f"{self.root}/{file_name}"):
+                    os.remove(f"{self.root}/{file_name}")
+
+        self.segments = []
+        self._assembled = {}
+        self._write_segment(df, None)
+
+    def append(self, df: pd.DataFrame, iteration: int) -> None:
+        self._write_segment(df, iteration)
+
+    def assemble(self, dest: str) -> None:
+        """
+        Brings dest up to date with the segments: only the segments it does not
+        hold yet are appended (it is rewritten if it was changed elsewhere).
+        """
+        n_segments = self._assembled.get(dest, 0)
+        expected = sum(segment["bytes"] for segment in self.segments[:n_segments])
+
+        if n_segments == 0 or not path.exists(dest) or os.path.getsize(dest) != expected:
+            n_segments = 0
+            mode = "wb"
+        else:
+            mode = "ab"
+
+        with open(dest, mode) as f_out:
+            for segment in self.segments[n_segments:]:
+                with open(f"{self.root}/{segment['txt']}", "rb") as f_in:
+                    shutil.copyfileobj(f_in, f_out)
+
+        self._assembled[dest] = len(self.segments)
+
+    def save_manifest(self, dest_dir: str) -> None:
+        """
+        Records the segments that make up the corpus at this point (e.g. of an iteration).
+        """
+        self._save_manifest(f"{dest_dir}/manifest.json")
+
+    def to_dataframe(self) -> pd.DataFrame:
+        frames = [pd.read_json(f"{self.root}/{segment['jsonl']}", orient="records", lines=True) for segment in self.segments]
+
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
@@ -0,0 +1,54 @@
+import numpy as np
+
+from vector_store import VectorStore, content_hash
+
+
+class EmbeddingCache:
+    """
+    Sentence embeddings stored on disk, keyed by the hash of the sentence
+    text, one store per embedding model. Only sentences never seen before
+    are sent to the encoder.
+    """
+
+    def __init__(self, root: str, model_name: str, dtype: str = "float32") -> None:
+        self.model_name = model_name
+        self.store = VectorStore("{root}/{model}".format(root=root, model=model_name.replace("/", "__")), dtype=dtype)
+
+    def update(self, model, sentences: list, batch_size: int = 32) -> list:
+        """
+        :param model: SentenceTransformer used for the sentences missing from the cache
+        :param sentences: list of sentences
+        :param batch_size: encoding batch size
+        :return list: cache key of each sentence
+        """
+        keys = [content_hash(sentence) for sentence in sentences]
+
+        # unique sentences that were never encoded with this model
+        missing = {}
+        for key, sentence in zip(keys, sentences):
+            if key not in self.store and key not in missing:
+                missing[key] = sentence
+
+        if missing:
+            print("Encoding {n} new sentences...".format(n=len(missing)))
+            embeddings = model.encode(list(missing.values()), batch_size=batch_size, convert_to_numpy=True)
+            self.store.add(list(missing.keys()), [embedding[None, :] for embedding in embeddings])
+
+        return keys
+
+    def rows(self, model, sentences: list, batch_size: int = 32) -> np.ndarray:
+        """
+        :return np.ndarray: row of each sentence in self.store.data (memory-mapped, nothing is loaded)
+        """
+        return self.store.offsets(self.update(model, sentences, batch_size))
+
+    def encode(self, model, sentences: list, batch_size: int = 32) -> np.ndarray:
+        """
+        :return np.ndarray: float32 embeddings (len(sentences) x dim), in input order
+        """
+        rows = self.rows(model, sentences, batch_size)
+
+        if len(rows) == 0:
+            return np.zeros((0, self.store.dim or 0), dtype=np.float32)
+
+        return np.asarray(self.store.data[rows], dtype=np.float32)
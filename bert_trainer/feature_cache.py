@@ -0,0 +1,68 @@
+import numpy as np
+import torch
+from tqdm import tqdm
+
+from vector_store import VectorStore, content_hash
+
+
+class FeatureCache:
+    """
+    Token features of a frozen encoder, computed once per sentence and kept in
+    a memory-mapped file. The features are set on the flair tokens under the
+    embedding name, so flair's embed() sees them as already embedded and the
+    transformer never runs again for those sentences (with
+    embeddings_storage_mode="cpu" they also survive between epochs).
+    """
+
+    def __init__(self, root: str, name: str, embeddings, batch_size: int = 32) -> None:
+        """
+        :param root: cache directory
+        :param name: identifies the encoder and its configuration (checkpoint, layers, pooling)
+        :param embeddings: frozen flair TokenEmbeddings
+        :param batch_size: sentences per forward pass for the sentences not in the cache
+        """
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+
+        # copy-on-write: torch gets writable tensors while the pages stay shared with the file
+        self.store = VectorStore("{root}/{name}".format(root=root, name=name.replace("/", "__")), dtype="float32", mmap_mode="c")
+
+    def _compute(self, sentences: list) -> None:
+        missing = {}
+        for sentence in sentences:
+            key = content_hash(" ".join(token.text for token in sentence))
+            if key not in self.store and key not in missing:
+                missing[key] = sentence
+
+        if not missing:
+            return
+
+        print("Computing frozen features for {n} sentences...".format(n=len(missing)))
+        keys = list(missing.keys())
+
+        for start in tqdm(range(0, len(keys), self.batch_size)):
+            batch_keys = keys[start:start + self.batch_size]
+            batch = [missing[key] for key in batch_keys]
+
+            with torch.no_grad():
+                self.embeddings.embed(batch)
+
+            features = [torch.stack([token.get_embedding([self.embeddings.name]) for token in sentence]).cpu().numpy() for sentence in batch]
+            self.store.add(batch_keys, features)
+
+            for sentence in batch:
+                sentence.clear_embeddings()
+
+    def populate(self, sentences: list) -> None:
+        """
+        Sets the cached features on every token of the sentences, computing
+        only the sentences never seen before.
+        """
+        sentences = list(sentences)
+        self._compute(sentences)
+
+        for sentence in sentences:
+            rows = self.store.get(content_hash(" ".join(token.text for token in sentence)))
+
+            for token, row in zip(sentence, rows):
+                token.set_embedding(self.embeddings.name, torch.from_numpy(row))
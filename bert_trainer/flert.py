@@ -8,9 +8,13 @@ from flair.data import Corpus
 from flair.datasets import ColumnCorpus
 from flair.data import Sentence
 from flair.models import SequenceTagger
+from flair.file_utils import load_torch_state
+
+from feature_cache import FeatureCache
 
 from tqdm import tqdm
-from seqeval.metrics import classification_report
+from metrics import read_flair_tsv, report_from_ids, sentences_to_ids
+from profiling import profiler, span
 from copy import deepcopy
 from os import path
 import os
@@ -19,10 +23,12 @@ import json
 
 
 class Training:
-    def __init__(self, data_folder, corpus_name, model_checkpoint, model_name, output_dir_list) -> None:
+    def __init__(self, data_folder, corpus_name, model_checkpoint, model_name, output_dir_list, feature_cache_dir=None, train_file='train.txt') -> None:
         self.model_checkpoint = model_checkpoint
         self.model_name = model_name
         self.output_dir_list = output_dir_list
+        self.feature_cache_dir = feature_cache_dir
+        self.train_file = train_file
         self.set_corpus(data_folder, corpus_name)
         
 
@@ -34,11 +40,13 @@ class Training:
 
         # this is the folder in which train, test and dev files reside
         print("Getting data from:", data_folder)
-        # init a corpus using column format, data folder and the names of the train, dev and test files
-        self.corpus: Corpus = ColumnCorpus(data_folder, columns,
-                                    train_file='train.txt',
-                                    test_file='test.txt',
-                                    dev_file='dev.txt')
+        with span("corpus_load", corpus=corpus_name) as record:
+            # init a corpus using column format, data folder and the names of the train, dev and test files
+            self.corpus: Corpus = ColumnCorpus(data_folder, columns,
+                                        train_file=self.train_file,
+                                        test_file='test.txt',
+                                        dev_file='dev.txt')
+            record["items"] = sum(len(split) for split in [self.corpus.train, self.corpus.dev, self.corpus.test] if split is not None)
         print(self.corpus)
 
         # 2. what label do we want to predict?
@@ -49,8 +57,8 @@ class Training:
         print(self.label_dict)
 
     def _create_directory(self, ref):
-        if path.exists(ref) == False:
-            os.mkdir(ref)
+        # several fold jobs may create the same directories at the same time
+        os.makedirs(ref, exist_ok=True)
 
     def _create_directory_recursive(self, root, dir_list):
         path = root
@@ -61,37 +69,43 @@ class Training:
 
         return path
 
-    def train(self, max_length, truncation, lr, num_epochs, use_crf, use_rnn, main_evaluation_metric):
+    def train(self, max_length, truncation, lr, num_epochs, use_crf, use_rnn, main_evaluation_metric, base_model=None):
         # 4. initialize fine-tuneable transformer embeddings WITH document context
-
         if use_rnn:
             layers = "all"
         else:
             layers = "-1"
 
-        embeddings = TransformerWordEmbeddings(model=self.model_checkpoint,
-                                                    layers=layers,
-                                                    subtoken_pooling="first",
-                                                    fine_tune= not use_rnn,
-                                                    use_context=False,
-                                                    #truncate=True,
-
-                                                    #force_max_length=True,
-                                                    transformers_tokenizer_kwargs={'truncation': True, 'model_max_length':512}
-                                                    #truncate=truncation,
-                                                    #truncate=truncation,
-                                                    #model_max_length=max_length,
-                                                    )
-
-        # 5. initialize bare-bones sequence tagger (no CRF, no RNN, no reprojection)
-        tagger = SequenceTagger(hidden_size=256,
-                                embeddings=embeddings,
-                                tag_dictionary=self.label_dict,
-                                tag_type='ner',
-                                use_crf= use_crf,
-                                use_rnn=use_rnn,
-                                reproject_embeddings=use_rnn
-                                )
+        if base_model is not None:
+            # warm start: keep training the model of a previous run (its embeddings and tag dictionary)
+            tagger = SequenceTagger.load(base_model)
+        else:
+            embeddings = TransformerWordEmbeddings(model=self.model_checkpoint,
+                                                        layers=layers,
+                                                        subtoken_pooling="first",
+                                                        fine_tune= not use_rnn,
+                                                        use_context=False,
+                                                        #truncate=True,
+
+                                                        #force_max_length=True,
+                                                        transformers_tokenizer_kwargs={'truncation': True, 'model_max_length':512}
+                                                        #truncate=truncation,
+                                                        #truncate=truncation,
+                                                        #model_max_length=max_length,
+                                                        )
+
+            # 5. initialize bare-bones sequence tagger (no CRF, no RNN, no reprojection)
+            tagger = SequenceTagger(hidden_size=256,
+                                    embeddings=embeddings,
+                                    tag_dictionary=self.label_dict,
+                                    tag_type='ner',
+                                    use_crf= use_crf,
+                                    use_rnn=use_rnn,
+                                    reproject_embeddings=use_rnn
+                                    )
+
+        # in-memory handle of the trained model (after training, the weights used for the test evaluation)
+        self.tagger = tagger
 
         # 6. initialize trainer
         trainer = ModelTrainer(tagger, self.corpus)
@@ -100,11 +114,35 @@ class Training:
         output_dir = deepcopy(self.output_dir_list)
         output_dir.insert(0, "models")
         output_dir = self._create_directory_recursive(".", output_dir)
+        self.model_dir = output_dir
+
+        # one span per epoch when profiling is on (the final test evaluation is the rest of the train span), a torch trace of a few steps
+        plugins = [plugin for plugin in [profiler.epoch_plugin(items=len(self.corpus.train)), profiler.step_trace_plugin()] if plugin is not None]
 
         if use_rnn:
-            trainer.train()
+            # frozen encoder: its features are computed once per sentence and kept on the tokens between epochs
+            if self.feature_cache_dir is not None:
+                features = FeatureCache(self.feature_cache_dir, "{checkpoint}-layers_{layers}-first".format(checkpoint=self.model_checkpoint, layers=layers), tagger.embeddings)
+                for split in [self.corpus.train, self.corpus.dev, self.corpus.test]:
+                    if split is not None:
+                        with span("feature_cache", items=len(split)):
+                            features.populate(split)
+
+            with span("train", epochs=num_epochs):
+                trainer.train(output_dir, max_epochs=num_epochs, use_final_model_for_eval=False, main_evaluation_metric=main_evaluation_metric, embeddings_storage_mode="cpu", plugins=plugins)
         else:
-            trainer.fine_tune(output_dir, learning_rate=lr, use_final_model_for_eval=False, max_epochs=num_epochs, main_evaluation_metric=main_evaluation_metric)
+            with span("train", epochs=num_epochs):
+                trainer.fine_tune(output_dir, learning_rate=lr, use_final_model_for_eval=False, max_epochs=num_epochs, main_evaluation_metric=main_evaluation_metric, plugins=plugins)
+
+    def final_tagger(self):
+        """
+        :return SequenceTagger: self.tagger with the weights saved as final-model.pt, the file a Pipeline of the model directory loads
+        """
+        # flair puts the best-model.pt weights back in memory for the test evaluation
+        if path.exists(f"{self.model_dir}/best-model.pt"):
+            self.tagger.load_state_dict(load_torch_state(f"{self.model_dir}/final-model.pt")["state_dict"])
+
+        return self.tagger
 
     def get_prediction(self, tagger, text):
         # make a sentence
@@ -149,68 +187,37 @@ class Training:
         with open(f"{path}/{file_name}", "w", encoding='utf-8') as outfile:
             json.dump(json_object, outfile)
 
-    def get_metrics_file(self, txt_file):
-        # Inicializar listas para armazenar y_true e y_pred
-        y_true = []
-        y_pred = []
-       
-        # Abrir o arquivo TXT e ler linha por linha
-        with open(txt_file, 'r', encoding='utf-8') as file:
-            sentence_true = []
-            sentence_pred = []
-
-            for line in file:
-                # Dividir a linha em três partes usando espaços ou tabulações como delimitadores
-                parts = line.strip().split()
-                
-                # Verificar se a linha possui três partes
-                if len(parts) == 3:
-                    # Adicionar tag original à lista da sentença y_true
-                    sentence_true.append(parts[1])
-                    # Adicionar tag predita à lista da sentença y_pred
-                    sentence_pred.append(parts[2])
-                else:
-                    # Se a linha não tem três partes, consideramos que uma nova sentença começou
-                    if sentence_true and sentence_pred:
-                        y_true.append(sentence_true)
-                        y_pred.append(sentence_pred)
-                        # Reiniciar listas para a próxima sentença
-                        sentence_true = []
-                        sentence_pred = []
-            
-            # Adicionar a última sentença, se houver
-            if sentence_true and sentence_pred:
-                y_true.append(sentence_true)
-                y_pred.append(sentence_pred)
-        
-        return y_true, y_pred
+    def evaluate(self, sentences=None, mini_batch_size=32):
+        """
+        :param sentences: flair sentences with gold 'ner' labels (test split by default)
+        :param mini_batch_size: sentences per forward pass
+        :return dict: seqeval-compatible report of self.tagger on the sentences, without writing any file
+        """
+        if sentences is None:
+            sentences = list(self.corpus.test)
+
+        with span("test_evaluation", items=len(sentences), profile_torch=True):
+            self.tagger.predict(sentences, mini_batch_size=mini_batch_size, label_name="predicted")
+
+        vocabulary = {}
+        eval_ids, pred_ids = sentences_to_ids(sentences, "ner", "predicted", vocabulary)
+
+        for sentence in sentences:
+            sentence.remove_labels("predicted")
+
+        return report_from_ids(eval_ids, pred_ids, list(vocabulary))
 
     def get_and_save_metrics_test(self):
         output_dir = deepcopy(self.output_dir_list)
         output_dir.insert(0, "models")
         output_dir = self._create_directory_recursive(".", output_dir)
 
-        #Getting from tsv
-        #new_file = open("{output_dir}/test.txt".format(output_dir=output_dir), "w+", encoding="utf8")
-
-        with open("{output_dir}/test.tsv".format(output_dir=output_dir), "r", encoding="utf8") as file, open(f"{output_dir}/test.txt", "w", encoding="utf8") as new_file:
-            for line in file:
-                if line != "\n":
-                    splited = line.split(" ")
-                    if splited[0] != '':
-                        line = line.strip()
-                        spliter = line.split(" ")
-                        token = spliter[0]
-                        tag_1 = spliter[1]
-                        tag_2 = spliter[2]
-                        new_file.write(str(token)+" "+str(tag_1)+" "+str(tag_2)+"\n")
-                else:
-                    new_file.write("\n")
-
-        #Metrics
-        print(f'{output_dir}/test.txt')
-        eval_labels, pred_labels = self.get_metrics_file('{output_dir}/test.txt'.format(output_dir=output_dir))
-        metrics = classification_report(eval_labels, pred_labels, digits=4, output_dict=True)
+        #Metrics straight from the tsv (token, gold and predicted label per line)
+        print(f'{output_dir}/test.tsv')
+        vocabulary = {}
+        with span("test_metrics"):
+            eval_ids, pred_ids = read_flair_tsv('{output_dir}/test.tsv'.format(output_dir=output_dir), vocabulary)
+            metrics = report_from_ids(eval_ids, pred_ids, list(vocabulary))
         metrics = self.convert_to_float(metrics)
 
         self._create_directory("metrics")
@@ -1,49 +1,253 @@
+import flair
+import numpy as np
+from os import path
 from flair.models import SequenceTagger
 from flair.data import Sentence
 
+from model_cache import checkpoint_file, load_tagger
+from prediction_cache import PredictionCache, checkpoint_fingerprint
+from quantization import quantize_tagger
+
+
+def tokenize_words(tokenizer, words: list):
+    """
+    :return tuple: subword ids (no special tokens) and index of the first subword of every word (-1 if none)
+    """
+    if getattr(tokenizer, "is_fast", False):
+        encoding = tokenizer(words, is_split_into_words=True, add_special_tokens=False)
+        ids = encoding["input_ids"]
+        word_ids = encoding.word_ids()
+    else:
+        ids = []
+        word_ids = []
+        for idx, word in enumerate(words):
+            word_subwords = tokenizer.encode(word, add_special_tokens=False)
+            ids.extend(word_subwords)
+            word_ids.extend([idx] * len(word_subwords))
+
+    first = [-1] * len(words)
+    for position, word_id in reversed(list(enumerate(word_ids))):
+        if word_id is not None:
+            first[word_id] = position
+
+    return np.asarray(ids, dtype=np.int32), np.asarray(first, dtype=np.int32)
+
+
+def word_lengths(first: np.ndarray, n_subwords: int) -> np.ndarray:
+    """
+    :return np.ndarray: number of subwords of each word, from the first-subword alignment
+    """
+    # a word ends where the next word that has subwords starts
+    lengths = np.zeros(len(first), dtype=np.int64)
+    end = n_subwords
+    for idx in range(len(first) - 1, -1, -1):
+        if first[idx] >= 0:
+            lengths[idx] = end - first[idx]
+            end = first[idx]
+
+    return lengths
+
+
 class Pipeline:
-    def __init__(self, checkpoint) -> None:
-        self.tagger = SequenceTagger.load('{checkpoint}/final-model.pt'.format(checkpoint=checkpoint))
-
-    def split_text(self, text, max_length):
-        tokens = text.split()
-        sentences = []
-
-        for i in range(0, len(tokens), max_length):
-            sentences.append(' '.join(tokens[i:i + max_length]))
-
-        return sentences
-        
-        
-    def get_prediction(self, text, max_length=512):
-        # split sentence (> 512)
-        sentences_split = self.split_text(text, max_length)
-
-        for sentence_splited in sentences_split:
-            # make a sentence
-            sentence = Sentence(sentence_splited)
-
-            # predict NER tags
-            self.tagger.predict(sentence)
-
-            scores = []
-
-            # transfer entity labels to token level
-            for entity in sentence.get_spans('ner'):
-                prefix = 'B-'
-                for token in entity:
-                    token.set_label('ner-bio', prefix + entity.tag, entity.score)
-                    prefix = 'I-'
-                    scores.append(entity.score)
-
-            # now go through all tokens and print label
-            bio_tokens = []
-            for token in sentence:
-                try:
-                    #print(token.text, token.tag)
-                    bio_tokens.append(token.tag)
-                except:
-                    #print(token.text, "O")
-                    bio_tokens.append("O")
-                    
-        return {"entities": bio_tokens, "scores": scores}
\ No newline at end of file
+    def __init__(self, checkpoint=None, tagger: SequenceTagger = None, prediction_cache_dir: str = None, quantized: bool = False) -> None:
+        # int8 linear layers only run on CPU
+        if quantized and flair.device.type != "cpu":
+            raise ValueError("quantized inference runs on CPU only (flair.device is {device})".format(device=flair.device))
+
+        # an in-memory tagger (e.g. straight from Training.train) skips the checkpoint load
+        if tagger is None:
+            tagger = load_tagger(checkpoint, quantized=quantized)
+        elif quantized:
+            tagger = quantize_tagger(tagger)
+
+        self.tagger = tagger
+        self.tagger.eval()
+
+        # predictions already made by the same weights are read back instead of recomputed
+        self.predictions = None
+        if prediction_cache_dir is not None:
+            # an in-memory tagger given with its checkpoint has the weights of the checkpoint file
+            fingerprint = None
+            if checkpoint is not None and path.exists(checkpoint_file(checkpoint)):
+                fingerprint = checkpoint_fingerprint(checkpoint_file(checkpoint), quantized)
+            self.predictions = PredictionCache(prediction_cache_dir, self.tagger, fingerprint)
+
+    def max_subwords(self):
+        # subwords of a window, leaving room for the special tokens
+        tokenizer = getattr(self.tagger.embeddings, "tokenizer", None)
+
+        if tokenizer is None:
+            return 512
+
+        return min(tokenizer.model_max_length, 512) - tokenizer.num_special_tokens_to_add()
+
+    def word_subword_lengths(self, words):
+        # number of subwords of every word (falls back to one per word)
+        tokenizer = getattr(self.tagger.embeddings, "tokenizer", None)
+
+        if tokenizer is None:
+            return np.ones(len(words), dtype=np.int64)
+
+        ids, first = tokenize_words(tokenizer, words)
+        return word_lengths(first, len(ids))
+
+    def split_windows(self, lengths, max_subwords, overlap):
+        """
+        :param lengths: number of subwords of every word
+        :param max_subwords: subword budget of a window
+        :param overlap: subwords repeated between consecutive windows
+        :return list: (start, end) word ranges covering the text
+        """
+        n_words = len(lengths)
+        overlap = min(overlap, max_subwords // 2)
+        cumulative = np.concatenate([[0], np.cumsum(lengths)])
+
+        def window_end(start):
+            # furthest end within the budget (a window has at least one word)
+            end = int(np.searchsorted(cumulative, cumulative[start] + max_subwords, side="right")) - 1
+            return min(max(end, start + 1), n_words)
+
+        windows = []
+        start = 0
+        while start < n_words:
+            end = window_end(start)
+
+            # the overlap left no room for new words
+            if windows and end <= windows[-1][1]:
+                start = windows[-1][1]
+                end = window_end(start)
+
+            windows.append((start, end))
+
+            if end == n_words:
+                break
+
+            # the next window starts early enough to repeat about `overlap` subwords
+            next_start = int(np.searchsorted(cumulative, cumulative[end] - overlap, side="left"))
+            start = max(next_start, start + 1)
+
+        return windows
+
+    def merge_windows(self, n_words, windows, window_results):
+        """
+        Keeps, for every word, the prediction of the window where the word is
+        furthest from a cut, then repairs the BIO sequence at the seams.
+        """
+        tags = ["O"] * n_words
+        scores = [None] * n_words
+        margins = [-1] * n_words
+
+        for (start, end), (bio_tokens, token_scores) in zip(windows, window_results):
+            for offset, (tag, score) in enumerate(zip(bio_tokens, token_scores)):
+                idx = start + offset
+
+                # the text boundaries are not cuts
+                left = offset if start > 0 else n_words
+                right = end - 1 - idx if end < n_words else n_words
+                margin = min(left, right)
+
+                if margin > margins[idx]:
+                    margins[idx] = margin
+                    tags[idx] = tag
+                    scores[idx] = score
+
+        for idx, tag in enumerate(tags):
+            if tag.startswith("I-") and (idx == 0 or tags[idx - 1] == "O" or tags[idx - 1][2:] != tag[2:]):
+                tags[idx] = "B-" + tag[2:]
+
+        return tags, scores
+
+    def sentence_to_bio(self, sentence):
+        # transfer entity labels to token level
+        for entity in sentence.get_spans('ner'):
+            prefix = 'B-'
+            for token in entity:
+                token.set_label('ner-bio', prefix + entity.tag, entity.score)
+                prefix = 'I-'
+
+        # now go through all tokens and get label and score (None outside entities)
+        bio_tokens = []
+        token_scores = []
+        for token in sentence:
+            try:
+                bio_tokens.append(token.tag)
+                token_scores.append(token.score)
+            except:
+                bio_tokens.append("O")
+                token_scores.append(None)
+
+        return bio_tokens, token_scores
+
+    def get_prediction(self, text):
+        return self.predict_batch([text], batch_size=1)[0]
+
+    def predict_batch(self, texts, batch_size=32, max_subwords=None, overlap=64):
+        """
+        :param texts: list of whitespace tokenized texts to annotate
+        :param batch_size: number of windows per forward pass
+        :param max_subwords: subword budget of a window (default: the model limit)
+        :param overlap: subwords shared by consecutive windows of a long text
+        :return list: one {"entities", "scores", "token_scores"} dict per text, in input order
+            (scores of the entity words only, token_scores of every word with None outside entities)
+        """
+        if max_subwords is None:
+            max_subwords = self.max_subwords()
+
+        if self.predictions is None:
+            return [{"entities": tags, "scores": [score for score in token_scores if score is not None], "token_scores": list(token_scores)}
+                    for tags, token_scores in self._predict(texts, batch_size, max_subwords, overlap)]
+
+        keys = self.predictions.keys(texts, max_subwords, overlap)
+
+        # unique texts this model never annotated
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self.predictions.store and key not in missing:
+                missing[key] = text
+
+        fresh = {}
+        if missing:
+            tags, token_scores = zip(*self._predict(list(missing.values()), batch_size, max_subwords, overlap))
+            self.predictions.add(list(missing.keys()), tags, token_scores)
+
+            for key, text_tags, text_scores in zip(missing, tags, token_scores):
+                fresh[key] = {"entities": list(text_tags), "scores": [score for score in text_scores if score is not None], "token_scores": list(text_scores)}
+
+        return [fresh[key] if key in fresh else self.predictions.get(key) for key in keys]
+
+    def _predict(self, texts, batch_size, max_subwords, overlap):
+        """
+        :return list: (BIO tags, score of every word or None) of each text
+        """
+        # flatten the texts into windows, remembering which text each one belongs to
+        words = [text.split() for text in texts]
+        windows = []
+        window_lengths = []
+        for idx, text_words in enumerate(words):
+            lengths = self.word_subword_lengths(text_words)
+
+            for start, end in self.split_windows(lengths, max_subwords, overlap):
+                windows.append((idx, start, end))
+                window_lengths.append(int(lengths[start:end].sum()))
+
+        # bucket by subword length so each padded batch wastes as little as possible
+        order = sorted(range(len(windows)), key=lambda i: window_lengths[i])
+
+        window_results = [None] * len(windows)
+        for start in range(0, len(order), batch_size):
+            batch_idx = order[start:start + batch_size]
+            sentences = [Sentence(words[windows[i][0]][windows[i][1]:windows[i][2]]) for i in batch_idx]
+
+            self.tagger.predict(sentences, mini_batch_size=len(sentences))
+
+            for i, sentence in zip(batch_idx, sentences):
+                window_results[i] = self.sentence_to_bio(sentence)
+
+        # windows of the same text are merged back into one BIO sequence
+        per_text = [([], []) for _ in texts]
+        for (idx, start, end), result in zip(windows, window_results):
+            per_text[idx][0].append((start, end))
+            per_text[idx][1].append(result)
+
+        return [self.merge_windows(len(text_words), text_windows, text_results)
+                for text_words, (text_windows, text_results) in zip(words, per_text)]
@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+import time
+from os import path
+
+import torch
+
+from flert import Training
+from profiling import span
+
+
+def job_done(output_dir_list) -> bool:
+    # a job is finished once both its metrics and its time were written
+    output_dir = "/".join(output_dir_list)
+    return path.exists(f"./metrics/{output_dir}/test.json") and path.exists(f"./time/{output_dir}/time.txt")
+
+
+def run_job(job: dict, num_threads: int = None) -> None:
+    """
+    Trains and evaluates one (architecture, fold) job, writing to the same
+    models/, metrics/ and time/ trees as the sequential loop.
+    """
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+    output_dir_list = job["output_dir_list"]
+
+    with span("job", job="/".join(output_dir_list)):
+        trainer = Training(job["data_folder"], job["corpus_name"], job["model_checkpoint"], job["model_name"], output_dir_list, **job.get("training_kwargs", {}))
+
+        print("================================")
+        print("Starting training: {model_name}, {model_checkpoint}".format(model_name=job["model_name"], model_checkpoint=job["model_checkpoint"]))
+        print("Job:", "/".join(output_dir_list))
+        print("================================")
+
+        start_time = time.time()
+        trainer.train(*job["train_args"])
+        y_probs, metrics = trainer.get_and_save_metrics_test()
+        print("--- %s seconds ---" % (time.time() - start_time))
+
+    output_dir = trainer._create_directory_recursive(".", ["time"] + output_dir_list)
+
+    with open(f"{output_dir}/time.txt", "w", encoding="utf-8") as f_out:
+        print("%s seconds" % (time.time() - start_time), file=f_out)
+
+
+class FoldScheduler:
+    def __init__(self, workers: int = 1, num_threads: int = None, retries: int = 0) -> None:
+        """
+        :param workers: number of jobs running at the same time (1 runs them in this process)
+        :param num_threads: torch threads per worker, default splits the cores between the workers
+        :param retries: times a failed or killed job is started again
+        """
+        self.workers = workers
+        self.num_threads = num_threads if num_threads is not None else max(1, (os.cpu_count() or 1) // workers)
+        self.retries = retries
+
+    def _run_sequential(self, jobs: list) -> list:
+        failed = []
+
+        for job in jobs:
+            try:
+                run_job(job)
+            except Exception as e:
+                print("Job failed:", "/".join(job["output_dir_list"]), repr(e))
+                failed.append(job)
+
+        return failed
+
+    def _run_parallel(self, jobs: list) -> list:
+        # fork: the entry scripts run at import time, so the workers must not re-import them
+        context = multiprocessing.get_context("fork")
+        pending = list(jobs)
+        running = []
+        failed = []
+
+        while pending or running:
+            while pending and len(running) < self.workers:
+                job = pending.pop(0)
+                process = context.Process(target=run_job, args=(job, self.num_threads))
+                process.start()
+                running.append((process, job))
+
+            time.sleep(1)
+
+            for process, job in list(running):
+                if process.is_alive():
+                    continue
+
+                process.join()
+                running.remove((process, job))
+
+                # a killed worker has a negative exit code
+                if process.exitcode != 0:
+                    print("Job failed:", "/".join(job["output_dir_list"]), "exit code", process.exitcode)
+                    failed.append(job)
+
+        return failed
+
+    def run(self, jobs: list) -> list:
+        """
+        :param jobs: job dicts with data_folder, corpus_name, model_checkpoint, model_name, output_dir_list and train_args
+        :return list: jobs that still failed after the retries
+        """
+        # finished jobs (e.g. from an interrupted sweep) are not trained again
+        pending = [job for job in jobs if not job_done(job["output_dir_list"])]
+        print("Jobs: {pending} to run, {done} already done".format(pending=len(pending), done=len(jobs) - len(pending)))
+
+        for attempt in range(self.retries + 1):
+            if not pending:
+                break
+
+            if attempt > 0:
+                print("Retrying {n} failed jobs...".format(n=len(pending)))
+
+            if self.workers == 1:
+                pending = self._run_sequential(pending)
+            else:
+                pending = self._run_parallel(pending)
+
+        return pending
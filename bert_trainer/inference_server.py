@@ -0,0 +1,253 @@
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def bio_to_spans(text: str, tags: list, scores: list) -> list:
+    """
+    :param text: whitespace tokenized text
+    :param tags: BIO tag of every word
+    :param scores: score of every word inside an entity, in order
+    :return list: entities with type, word range, character range, text and score
+    """
+    words = text.split()
+
+    # character offsets of the words
+    offsets = []
+    position = 0
+    for word in words:
+        start = text.find(word, position)
+        offsets.append((start, start + len(word)))
+        position = start + len(word)
+
+    spans = []
+    scores = iter(scores)
+    for idx, tag in enumerate(tags):
+        if tag == "O":
+            continue
+
+        score = next(scores, None)
+        if tag.startswith("B-") or not spans or spans[-1]["end_token"] != idx or spans[-1]["entity"] != tag[2:]:
+            spans.append({"entity": tag[2:], "start_token": idx, "end_token": idx + 1, "scores": [score]})
+        else:
+            spans[-1]["end_token"] = idx + 1
+            spans[-1]["scores"].append(score)
+
+    for span in spans:
+        span_scores = [score for score in span.pop("scores") if score is not None]
+        span["start"] = offsets[span["start_token"]][0]
+        span["end"] = offsets[span["end_token"] - 1][1]
+        span["text"] = text[span["start"]:span["end"]]
+        span["score"] = sum(span_scores) / len(span_scores) if span_scores else None
+
+    return spans
+
+
+class MicroBatcher:
+    """
+    Collects the texts of concurrent requests into one Pipeline.predict_batch
+    call: a batch is closed when it reaches max_batch_size or when its first
+    text waited max_wait_ms.
+    """
+
+    def __init__(self, pipe, max_batch_size: int = 32, max_wait_ms: float = 10) -> None:
+        self.pipe = pipe
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self.queue = asyncio.Queue()
+        # one forward pass at a time, outside the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+        self.started = time.time()
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.batch_sizes = deque(maxlen=1000)
+        self.latencies = deque(maxlen=1000)
+
+    async def predict(self, texts: list) -> list:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+
+        futures = [loop.create_future() for _ in texts]
+        for text, future in zip(texts, futures):
+            await self.queue.put((text, future))
+
+        results = await asyncio.gather(*futures)
+
+        self.requests += 1
+        self.latencies.append(time.perf_counter() - start)
+
+        return results
+
+    async def _next_batch(self):
+        loop = asyncio.get_running_loop()
+
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = await self._next_batch()
+            texts = [text for text, _ in batch]
+
+            try:
+                predictions = await loop.run_in_executor(self.executor, self.pipe.predict_batch, texts, self.max_batch_size)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (text, future), prediction in zip(batch, predictions):
+                if not future.done():
+                    future.set_result(bio_to_spans(text, prediction["entities"], prediction["scores"]))
+
+            self.batches += 1
+            self.texts += len(batch)
+            self.batch_sizes.append(len(batch))
+
+    def stats(self) -> dict:
+        uptime = time.time() - self.started
+        latencies = np.asarray(self.latencies) * 1000
+
+        return {
+            "uptime_seconds": uptime,
+            "requests": self.requests,
+            "texts": self.texts,
+            "batches": self.batches,
+            "texts_per_second": self.texts / uptime if uptime > 0 else 0,
+            "mean_batch_size": float(np.mean(self.batch_sizes)) if self.batch_sizes else 0,
+            "latency_ms": {
+                "p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+                "p95": float(np.percentile(latencies, 95)) if len(latencies) else None,
+                "p99": float(np.percentile(latencies, 99)) if len(latencies) else None,
+            },
+            "queued": self.queue.qsize(),
+        }
+
+
+class InferenceServer:
+    """
+    Minimal HTTP/1.1 service around a MicroBatcher:
+
+    POST /predict  {"text": "..."} or {"texts": ["...", ...]} -> entities (spans)
+    GET  /stats    throughput and latency
+    GET  /health   liveness check
+    """
+
+    REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+    def __init__(self, pipe, host: str = "127.0.0.1", port: int = 8000, max_batch_size: int = 32, max_wait_ms: float = 10) -> None:
+        self.pipe = pipe
+        self.host = host
+        self.port = port
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+    async def _respond(self, writer, status: int, body: dict, keep_alive: bool) -> None:
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        headers = [
+            f"HTTP/1.1 {status} {self.REASONS[status]}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(payload)}",
+            "Connection: keep-alive" if keep_alive else "Connection: close",
+        ]
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + payload)
+        await writer.drain()
+
+    async def _route(self, method: str, target: str, body: bytes):
+        if target == "/health":
+            return 200, {"status": "ok"}
+
+        if target == "/stats":
+            return 200, self.batcher.stats()
+
+        if target != "/predict":
+            return 404, {"error": f"unknown path {target}"}
+
+        if method != "POST":
+            return 405, {"error": "use POST"}
+
+        try:
+            request = json.loads(body or b"{}")
+        except json.JSONDecodeError as e:
+            return 400, {"error": f"invalid JSON: {e}"}
+
+        if "texts" in request and isinstance(request["texts"], list):
+            return 200, {"entities": await self.batcher.predict([str(text) for text in request["texts"]])}
+
+        if "text" in request:
+            return 200, {"entities": (await self.batcher.predict([str(request["text"])]))[0]}
+
+        return 400, {"error": "expected a 'text' or 'texts' field"}
+
+    async def _handle(self, reader, writer) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "malformed request line"}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+                try:
+                    status, response = await self._route(method, target.split("?")[0], body)
+                except Exception as e:
+                    status, response = 500, {"error": repr(e)}
+
+                await self._respond(writer, status, response, keep_alive)
+
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self) -> None:
+        self.batcher = MicroBatcher(self.pipe, self.max_batch_size, self.max_wait_ms)
+        batcher_task = asyncio.create_task(self.batcher.run())
+
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"Serving on http://{self.host}:{self.port}")
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher_task.cancel()
@@ -0,0 +1,239 @@
+import numpy as np
+
+OUTSIDE = "O"
+
+
+def encode(sequences: list, vocabulary: dict) -> np.ndarray:
+    """
+    :param sequences: list of sentences, each one a list of labels
+    :param vocabulary: label -> id, new labels are added to it
+    :return np.ndarray: label ids of all the sentences, an OUTSIDE id after each one (as seqeval flattens them)
+    """
+    outside = vocabulary.setdefault(OUTSIDE, len(vocabulary))
+
+    ids = []
+    for sequence in sequences:
+        for label in sequence:
+            if label not in vocabulary:
+                vocabulary[label] = len(vocabulary)
+            ids.append(vocabulary[label])
+        ids.append(outside)
+
+    return np.asarray(ids, dtype=np.int32)
+
+
+def label_parts(labels: list):
+    """
+    :return tuple: tag character and type id of every label, the names of the types
+    """
+    # read as seqeval does in its default (conlleval) mode: "B-PER" -> ("B", "PER"), "O" -> ("O", "_")
+    tags = np.asarray([ord(label[0]) for label in labels], dtype=np.int32)
+    type_names = [label[1:].split("-", maxsplit=1)[-1] or "_" for label in labels]
+
+    type_ids = {}
+    types = np.asarray([type_ids.setdefault(name, len(type_ids)) for name in type_names], dtype=np.int32)
+
+    return tags, types, list(type_ids)
+
+
+def get_entities(ids: np.ndarray, labels: list):
+    """
+    Vectorized seqeval.metrics.sequence_labeling.get_entities.
+
+    :param ids: label ids (see encode)
+    :param labels: label of every id
+    :return tuple: type id, first and last position of every entity, the names of the types
+    """
+    if OUTSIDE not in labels:
+        labels = list(labels) + [OUTSIDE]
+
+    tags, types, type_names = label_parts(labels)
+    B, I, E, S, O, DOT = (ord(tag) for tag in "BIESO.")
+
+    # the sequence is followed by an OUTSIDE label and preceded by a virtual one with no type
+    tag = np.append(tags[ids], O)
+    typ = np.append(types[ids], types[labels.index(OUTSIDE)])
+    prev_tag = np.insert(tag[:-1], 0, O)
+    prev_typ = np.insert(typ[:-1], 0, -1)
+
+    changed_type = prev_typ != typ
+
+    # end_of_chunk(prev_tag, tag, prev_type, type_)
+    end = (prev_tag == E) | (prev_tag == S)
+    end |= ((prev_tag == B) | (prev_tag == I)) & ((tag == B) | (tag == S) | (tag == O))
+    end |= (prev_tag != O) & (prev_tag != DOT) & changed_type
+
+    # start_of_chunk(prev_tag, tag, prev_type, type_)
+    start = (tag == B) | (tag == S)
+    start |= ((prev_tag == E) | (prev_tag == S) | (prev_tag == O)) & ((tag == E) | (tag == I))
+    start |= (tag != O) & (tag != DOT) & changed_type
+
+    # an entity ending at i began at the last start before i
+    end_positions = np.flatnonzero(end)
+    start_positions = np.flatnonzero(start)
+    last_start = np.searchsorted(start_positions, end_positions, side="left") - 1
+    begins = np.where(last_start >= 0, start_positions[np.maximum(last_start, 0)] if len(start_positions) else 0, 0)
+
+    return prev_typ[end_positions], begins, end_positions - 1, type_names
+
+
+def _counts(true_ids: np.ndarray, pred_ids: np.ndarray, labels: list):
+    true_types, true_begins, true_ends, type_names = get_entities(true_ids, labels)
+    pred_types, pred_begins, pred_ends, _ = get_entities(pred_ids, labels)
+
+    # an entity is one integer, (type, begin, end) in mixed radix
+    radix = max(len(true_ids), len(pred_ids)) + 1
+    true_keys = (true_types.astype(np.int64) * radix + true_begins) * radix + true_ends
+    pred_keys = (pred_types.astype(np.int64) * radix + pred_begins) * radix + pred_ends
+
+    n_types = len(type_names)
+    true_sum = np.bincount(true_types, minlength=n_types)
+    pred_sum = np.bincount(pred_types, minlength=n_types)
+    tp_sum = np.bincount(true_types[np.isin(true_keys, pred_keys)], minlength=n_types)
+
+    # only the types found in the gold or predicted entities, by name
+    present = [idx for idx in range(n_types) if true_sum[idx] > 0 or pred_sum[idx] > 0]
+    present.sort(key=lambda idx: type_names[idx])
+
+    return [type_names[idx] for idx in present], tp_sum[present], pred_sum[present], true_sum[present]
+
+
+def _divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    # zero_division="warn" of seqeval, without the warning
+    mask = denominator == 0
+    result = numerator / np.where(mask, 1, denominator)
+    result[mask] = 0.0
+
+    return result
+
+
+def _scores(tp_sum: np.ndarray, pred_sum: np.ndarray, true_sum: np.ndarray):
+    precision = _divide(tp_sum, pred_sum)
+    recall = _divide(tp_sum, true_sum)
+
+    denom = 1 * precision + recall
+    denom[denom == 0.] = 1
+    f_score = (1 + 1) * precision * recall / denom
+
+    return precision, recall, f_score
+
+
+def report_from_ids(true_ids: np.ndarray, pred_ids: np.ndarray, labels: list) -> dict:
+    """
+    Same dictionary as seqeval.metrics.classification_report(..., output_dict=True).
+
+    :param true_ids: gold label ids (see encode)
+    :param pred_ids: predicted label ids, aligned with true_ids
+    :param labels: label of every id
+    :return dict: precision, recall, f1-score and support per type and micro/macro/weighted avg
+    """
+    if len(true_ids) != len(pred_ids):
+        raise ValueError("Found input variables with inconsistent numbers of samples: [{}, {}]".format(len(true_ids), len(pred_ids)))
+
+    target_names, tp_sum, pred_sum, true_sum = _counts(np.asarray(true_ids), np.asarray(pred_ids), labels)
+    precision, recall, f_score = _scores(tp_sum, pred_sum, true_sum)
+
+    report = {}
+    for name, p, r, f, s in zip(target_names, precision, recall, f_score, true_sum):
+        report[name] = {"precision": float(p), "recall": float(r), "f1-score": float(f), "support": int(s)}
+
+    support = int(true_sum.sum())
+
+    micro = _scores(np.array([tp_sum.sum()]), np.array([pred_sum.sum()]), np.array([true_sum.sum()]))
+    report["micro avg"] = {"precision": float(micro[0][0]), "recall": float(micro[1][0]), "f1-score": float(micro[2][0]), "support": support}
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        macro = [float(np.average(values)) if len(values) else float("nan") for values in (precision, recall, f_score)]
+    report["macro avg"] = {"precision": macro[0], "recall": macro[1], "f1-score": macro[2], "support": support}
+
+    if support == 0:
+        weighted = [0.0, 0.0, 0.0]
+    else:
+        weighted = [float(np.average(values, weights=true_sum)) for values in (precision, recall, f_score)]
+    report["weighted avg"] = {"precision": weighted[0], "recall": weighted[1], "f1-score": weighted[2], "support": support}
+
+    return report
+
+
+def classification_report(y_true: list, y_pred: list) -> dict:
+    """
+    Drop-in for seqeval.metrics.classification_report(y_true, y_pred, output_dict=True).
+
+    :param y_true: list of sentences, each one a list of gold labels
+    :param y_pred: list of sentences, each one a list of predicted labels
+    """
+    if len(y_true) != len(y_pred) or any(len(t) != len(p) for t, p in zip(y_true, y_pred)):
+        raise ValueError("y_true and y_pred have different lengths")
+
+    vocabulary = {}
+    true_ids = encode(y_true, vocabulary)
+    pred_ids = encode(y_pred, vocabulary)
+
+    return report_from_ids(true_ids, pred_ids, list(vocabulary))
+
+
+def read_flair_tsv(file_path: str, vocabulary: dict):
+    """
+    Reads the "token gold predicted" lines flair writes after evaluating a model.
+
+    :return tuple: gold and predicted label ids (see encode)
+    """
+    outside = vocabulary.setdefault(OUTSIDE, len(vocabulary))
+
+    def label_id(label):
+        if label not in vocabulary:
+            vocabulary[label] = len(vocabulary)
+        return vocabulary[label]
+
+    true_ids = []
+    pred_ids = []
+    in_sentence = False
+
+    with open(file_path, "r", encoding="utf8") as file:
+        for line in file:
+            if line == "\n":
+                parts = None
+            elif line.startswith(" "):
+                continue
+            else:
+                token, gold, predicted = line.strip().split(" ")[:3]
+                parts = [gold, predicted] if len("{} {} {}".format(token, gold, predicted).split()) == 3 else None
+
+            if parts is None:
+                # end of the sentence
+                if in_sentence:
+                    true_ids.append(outside)
+                    pred_ids.append(outside)
+                    in_sentence = False
+                continue
+
+            true_ids.append(label_id(parts[0]))
+            pred_ids.append(label_id(parts[1]))
+            in_sentence = True
+
+    if in_sentence:
+        true_ids.append(outside)
+        pred_ids.append(outside)
+
+    return np.asarray(true_ids, dtype=np.int32), np.asarray(pred_ids, dtype=np.int32)
+
+
+def sentences_to_ids(sentences: list, gold_label_type: str, pred_label_type: str, vocabulary: dict):
+    """
+    BIO label ids of the gold and predicted spans of flair sentences.
+
+    :return tuple: gold and predicted label ids (see encode)
+    """
+    def bio(sentence, label_type):
+        tags = [OUTSIDE] * len(sentence)
+        for span in sentence.get_spans(label_type):
+            prefix = "B-"
+            for token in span:
+                tags[token.idx - 1] = prefix + span.get_label(label_type).value
+                prefix = "I-"
+        return tags
+
+    true_ids = encode([bio(sentence, gold_label_type) for sentence in sentences], vocabulary)
+    pred_ids = encode([bio(sentence, pred_label_type) for sentence in sentences], vocabulary)
+
+    return true_ids, pred_ids
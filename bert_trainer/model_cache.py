@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from os import path
+import os
+
+from flair.models import SequenceTagger
+
+from quantization import load_quantized
+
+# (checkpoint file, mtime, quantized) -> SequenceTagger, most recently used last
+_TAGGERS = OrderedDict()
+MAX_TAGGERS = 2
+
+
+def checkpoint_file(checkpoint: str, file_name: str = "final-model.pt") -> str:
+    if path.isdir(checkpoint):
+        return "{checkpoint}/{file_name}".format(checkpoint=checkpoint, file_name=file_name)
+
+    return checkpoint
+
+
+def _key(model_file: str, quantized: bool = False):
+    return (path.abspath(model_file), os.stat(model_file).st_mtime_ns, quantized)
+
+
+def _insert(key, tagger, max_size):
+    _TAGGERS[key] = tagger
+    _TAGGERS.move_to_end(key)
+
+    while len(_TAGGERS) > max_size:
+        _TAGGERS.popitem(last=False)
+
+
+def load_tagger(checkpoint: str, file_name: str = "final-model.pt", max_size: int = MAX_TAGGERS, quantized: bool = False) -> SequenceTagger:
+    """
+    :param checkpoint: model directory (or the model file itself)
+    :param file_name: model file inside the checkpoint directory
+    :param max_size: number of taggers kept in memory
+    :param quantized: int8 version of the model (see quantization.load_quantized)
+    :return SequenceTagger: tagger, loaded from disk only if the file changed since the last load
+    """
+    model_file = checkpoint_file(checkpoint, file_name)
+    key = _key(model_file, quantized)
+
+    if key in _TAGGERS:
+        _TAGGERS.move_to_end(key)
+        return _TAGGERS[key]
+
+    # an older version of the same file is no longer useful
+    for stale in [cached for cached in _TAGGERS if cached[0] == key[0] and cached[1] != key[1]]:
+        del _TAGGERS[stale]
+
+    tagger = load_quantized(model_file) if quantized else SequenceTagger.load(model_file)
+    _insert(key, tagger, max_size)
+
+    return tagger
+
+
+def register_tagger(checkpoint: str, tagger: SequenceTagger, file_name: str = "final-model.pt", max_size: int = MAX_TAGGERS) -> None:
+    """
+    Hands an in-memory tagger to the cache under the file it was saved to,
+    so the next load_tagger of that file skips the disk round trip.
+    """
+    model_file = checkpoint_file(checkpoint, file_name)
+    _insert(_key(model_file), tagger, max_size)
+
+
+def clear() -> None:
+    _TAGGERS.clear()
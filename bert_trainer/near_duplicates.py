@@ -0,0 +1,236 @@
+import json
+import multiprocessing
+import os
+import zlib
+from collections import deque
+from difflib import SequenceMatcher
+from os import path
+
+import numpy as np
+
+# hash values are taken modulo a Mersenne prime small enough for a * x + b to fit in 64 bits
+PRIME = (1 << 31) - 1
+
+
+def _permutations(num_perm: int, seed: int):
+    rng = np.random.default_rng(seed)
+    return rng.integers(1, PRIME, size=num_perm, dtype=np.uint64), rng.integers(0, PRIME, size=num_perm, dtype=np.uint64)
+
+
+def minhash_signatures(texts: list, num_perm: int = 128, shingle: int = 3, seed: int = 42, chunk_size: int = 16384) -> np.ndarray:
+    """
+    :param texts: sentences, compared as sets of lowercased word shingle-grams (the whole sentence if it is shorter)
+    :param chunk_size: shingles hashed at a time (memory is num_perm x chunk_size x 8 bytes)
+    :return np.ndarray: len(texts) x num_perm MinHash signatures (uint32)
+    """
+    a, b = _permutations(num_perm, seed)
+    signatures = np.full((len(texts), num_perm), PRIME, dtype=np.uint32)
+
+    tokens = [text.lower().split() for text in texts]
+    lengths = np.fromiter((len(sentence) for sentence in tokens), dtype=np.int64, count=len(tokens))
+    hashes = np.fromiter((zlib.crc32(token.encode("utf-8")) for sentence in tokens for token in sentence), dtype=np.uint64, count=int(lengths.sum()))
+
+    # shingles of all the sentences at once: the one starting at every word with width - 1 words after it in the sentence
+    sentence = np.repeat(np.arange(len(texts)), lengths)
+    ends = np.cumsum(lengths)
+    widths = np.minimum(shingle, lengths)[sentence]
+    positions = np.arange(len(hashes))
+
+    shingles = hashes.copy()
+    for offset in range(1, shingle):
+        # rolling combination of the token hashes (wraps around 2^64)
+        following = hashes[np.minimum(positions + offset, len(hashes) - 1)] if len(hashes) else hashes
+        shingles = np.where(offset < widths, shingles * np.uint64(1000003) + following, shingles)
+
+    valid = positions + widths <= ends[sentence]
+    shingles = shingles[valid] % np.uint64(PRIME)
+    sentence = sentence[valid]
+
+    # min over the shingles of every sentence, for groups of whole sentences of about chunk_size shingles
+    counts = np.bincount(sentence, minlength=len(texts))
+    starts = np.cumsum(counts) - counts
+    first = 0
+    while first < len(texts):
+        last = max(first + 1, int(np.searchsorted(starts, starts[first] + chunk_size, side="right")))
+        group = np.arange(first, last)[counts[first:last] > 0]
+
+        if len(group) > 0:
+            columns = shingles[starts[group[0]]:starts[group[-1]] + counts[group[-1]]]
+            hashed = (a[:, None] * columns[None, :] + b[:, None]) % np.uint64(PRIME)
+            signatures[group] = np.minimum.reduceat(hashed, starts[group] - starts[group[0]], axis=1).T
+
+        first = last
+
+    return signatures
+
+
+def propagate_tags(source_tokens: list, source_tags: list, target_tokens: list) -> list:
+    """
+    :return list: BIO tags of target_tokens, copied from the aligned tokens of the labeled source sentence (O elsewhere)
+    """
+    tags = ["O"] * len(target_tokens)
+
+    matcher = SequenceMatcher(None, source_tokens, target_tokens, autojunk=False)
+    for block in matcher.get_matching_blocks():
+        tags[block.b:block.b + block.size] = source_tags[block.a:block.a + block.size]
+
+    # an entity cut by the alignment starts again with B-
+    for idx, tag in enumerate(tags):
+        if tag.startswith("I-") and (idx == 0 or tags[idx - 1][2:] != tag[2:]):
+            tags[idx] = "B-" + tag[2:]
+
+    return tags
+
+
+class NearDuplicates:
+    """
+    Clusters of near-duplicate sentences: MinHash signatures of their word
+    shingles, LSH banding for the candidate pairs, and an estimated Jaccard
+    similarity of at least threshold to join a cluster. The corpus is read
+    once, in blocks; the first sentence of a cluster is its representative.
+
+    Only the blocks in flight are bounded: the LSH bucket tables (Python
+    dicts, one per band) and the signatures of the representatives are kept
+    for every cluster, about 3 KB per cluster with the default parameters
+    while building (mostly the dicts). Memory grows with the number of
+    clusters, not with the number of sentences.
+
+    root/meta.json            -> parameters and number of sentences
+    root/ids.npy              -> id of every sentence
+    root/representatives.npy  -> id of the representative of every sentence (itself for a representative)
+    """
+
+    def __init__(self, ids: np.ndarray, representatives: np.ndarray, meta: dict) -> None:
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.representatives = np.asarray(representatives, dtype=np.int64)
+        self.meta = meta
+
+        # the members of a cluster are a slice of order
+        self.order = np.argsort(self.representatives, kind="stable")
+        self.sorted_representatives = self.representatives[self.order]
+
+    @staticmethod
+    def parameters(threshold: float = 0.8, num_perm: int = 128, bands: int = 16, shingle: int = 3, seed: int = 42) -> dict:
+        """
+        :return dict: the parameters of a build, as saved in meta.json
+        """
+        return {"threshold": threshold, "num_perm": num_perm, "bands": bands, "shingle": shingle, "seed": seed}
+
+    @classmethod
+    def build(cls, blocks, threshold: float = 0.8, num_perm: int = 128, bands: int = 16, shingle: int = 3, workers: int = 1, seed: int = 42):
+        """
+        :param blocks: iterable of (ids, texts) blocks of the corpus
+        :param threshold: estimated Jaccard similarity to the representative to join its cluster
+        :param bands: LSH bands of num_perm / bands rows (more bands find less similar pairs)
+        :param workers: processes computing the signatures, while the main process clusters the previous blocks
+        """
+        rows = num_perm // bands
+        meta = cls.parameters(threshold, num_perm, bands, shingle, seed)
+
+        # one bucket table per band: band key -> representative (row of rep_signatures)
+        buckets = [{} for _ in range(bands)]
+        rep_signatures = np.zeros((1024, num_perm), dtype=np.uint32)
+        rep_ids = []
+
+        all_ids, representatives = [], []
+
+        def cluster(ids, signatures):
+            nonlocal rep_signatures
+
+            # band keys: rolling combination of the rows of every band
+            keys = signatures[:, :bands * rows].reshape(len(signatures), bands, rows).astype(np.uint64)
+            band_keys = keys[:, :, 0].copy()
+            for row in range(1, rows):
+                band_keys = band_keys * np.uint64(1000003) + keys[:, :, row]
+
+            block_representatives = np.empty(len(ids), dtype=np.int64)
+            for idx, (sentence_id, signature) in enumerate(zip(ids, signatures)):
+                candidates = {buckets[band].get(key) for band, key in enumerate(band_keys[idx].tolist())}
+                candidates.discard(None)
+
+                best, best_similarity = None, threshold
+                for candidate in candidates:
+                    similarity = float(np.mean(rep_signatures[candidate] == signature))
+                    if similarity >= best_similarity:
+                        best, best_similarity = candidate, similarity
+
+                if best is not None:
+                    block_representatives[idx] = rep_ids[best]
+                    continue
+
+                # new cluster
+                if len(rep_ids) == len(rep_signatures):
+                    rep_signatures = np.concatenate([rep_signatures, np.zeros_like(rep_signatures)])
+                rep_signatures[len(rep_ids)] = signature
+                for band, key in enumerate(band_keys[idx].tolist()):
+                    buckets[band].setdefault(key, len(rep_ids))
+                rep_ids.append(int(sentence_id))
+                block_representatives[idx] = sentence_id
+
+            all_ids.append(np.asarray(ids, dtype=np.int64))
+            representatives.append(block_representatives)
+
+        if workers > 1:
+            # fork: the entry scripts run at import time, so the workers must not re-import them
+            with multiprocessing.get_context("fork").Pool(workers) as pool:
+                # at most two blocks per worker are read ahead, memory does not grow with the corpus
+                pending = deque()
+                for ids, texts in blocks:
+                    pending.append((ids, pool.apply_async(minhash_signatures, (list(texts), num_perm, shingle, seed))))
+                    if len(pending) > 2 * workers:
+                        ids, result = pending.popleft()
+                        cluster(ids, result.get())
+
+                while pending:
+                    ids, result = pending.popleft()
+                    cluster(ids, result.get())
+        else:
+            for ids, texts in blocks:
+                cluster(ids, minhash_signatures(list(texts), num_perm, shingle, seed))
+
+        ids = np.concatenate(all_ids) if all_ids else np.zeros(0, dtype=np.int64)
+        meta["sentences"] = len(ids)
+
+        return cls(ids, np.concatenate(representatives) if representatives else np.zeros(0, dtype=np.int64), meta)
+
+    def save(self, root: str) -> None:
+        os.makedirs(root, exist_ok=True)
+        np.save(f"{root}/ids.npy", self.ids)
+        np.save(f"{root}/representatives.npy", self.representatives)
+
+        # the meta is written last, it marks the clusters as complete
+        with open(f"{root}/meta.json.{os.getpid()}.tmp", "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(f"{root}/meta.json.{os.getpid()}.tmp", f"{root}/meta.json")
+
+    @classmethod
+    def load(cls, root: str):
+        """
+        :return NearDuplicates: the clusters saved in root, or None
+        """
+        if not path.exists(f"{root}/meta.json"):
+            return None
+
+        with open(f"{root}/meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        return cls(np.load(f"{root}/ids.npy"), np.load(f"{root}/representatives.npy"), meta)
+
+    def __len__(self) -> int:
+        # number of clusters
+        return int((self.ids == self.representatives).sum())
+
+    def representative_ids(self) -> np.ndarray:
+        return self.ids[self.ids == self.representatives]
+
+    def duplicate_ids(self) -> np.ndarray:
+        return self.ids[self.ids != self.representatives]
+
+    def members(self, representative: int) -> np.ndarray:
+        """
+        :return np.ndarray: ids of the sentences of the cluster, the representative first
+        """
+        start, end = np.searchsorted(self.sorted_representatives, [representative, representative + 1])
+        members = self.ids[self.order[start:end]]
+
+        return np.concatenate([[representative], members[members != representative]]) if len(members) else members
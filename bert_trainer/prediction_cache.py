@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+from os import path
+
+import numpy as np
+import torch
+
+from vector_store import VectorStore, content_hash, file_hash
+
+
+def checkpoint_fingerprint(model_file: str, quantized: bool = False) -> str:
+    """
+    :return str: hash of the model file (hashed once per version of the file), the int8 model has its own predictions
+    """
+    return file_hash(model_file) + ("-int8" if quantized else "")
+
+
+def model_fingerprint(tagger) -> str:
+    """
+    :return str: hash of the weights and tag dictionary of an in-memory tagger, for taggers without a model file (reads every weight)
+    """
+    sha1 = hashlib.sha1()
+
+    def update(value):
+        # quantized layers keep packed (weight, bias) tuples and dtypes in their state dict
+        if isinstance(value, (tuple, list)):
+            for item in value:
+                update(item)
+        elif isinstance(value, torch.Tensor):
+            value = value.dequantize() if value.is_quantized else value
+            # raw bytes, numpy has no bfloat16
+            sha1.update(value.detach().cpu().contiguous().reshape(-1).view(torch.uint8).numpy().tobytes())
+        else:
+            sha1.update(repr(value).encode("utf-8"))
+
+    for name, value in tagger.state_dict().items():
+        sha1.update(name.encode("utf-8"))
+        update(value)
+
+    sha1.update("\n".join(tagger.label_dictionary.get_items()).encode("utf-8"))
+
+    return sha1.hexdigest()
+
+
+class PredictionCache:
+    """
+    Predictions of one model (see model_fingerprint), keyed by the hash of
+    the text and of the windowing settings. Every text is stored as one
+    (label id, score) row per word, the score is NaN outside entities
+    (flair scores come from float32 tensors, so they are stored exactly).
+    The labels of the ids are saved in labels.json, so the predictions can
+    be read back without the model.
+    """
+
+    def __init__(self, root: str, tagger=None, fingerprint: str = None) -> None:
+        """
+        :param root: directory of the caches of all models
+        :param tagger: model of the predictions (or None to only read the predictions of fingerprint)
+        :param fingerprint: checkpoint_fingerprint or model_fingerprint of the model (computed from the tagger when None)
+        """
+        self.fingerprint = fingerprint if fingerprint is not None else model_fingerprint(tagger)
+        self.store = VectorStore(f"{root}/{self.fingerprint}", dim=2, dtype="float32")
+        labels_path = f"{root}/{self.fingerprint}/labels.json"
+
+        if tagger is not None:
+            # BIO labels the tagger can produce (its dictionary is BIO or BIOES encoded), the ids are fixed for a fingerprint
+            types = []
+            for item in tagger.label_dictionary.get_items():
+                entity_type = item[2:] if item[:2] in ("B-", "I-", "E-", "S-") else item
+                if entity_type not in types and entity_type not in ("O", "<unk>", "<START>", "<STOP>"):
+                    types.append(entity_type)
+
+            self.labels = ["O"] + [prefix + entity_type for entity_type in types for prefix in ("B-", "I-")]
+
+            if not path.exists(labels_path):
+                with open(f"{labels_path}.{os.getpid()}.tmp", "w", encoding="utf-8") as f:
+                    json.dump(self.labels, f)
+                os.replace(f"{labels_path}.{os.getpid()}.tmp", labels_path)
+        else:
+            with open(labels_path, "r", encoding="utf-8") as f:
+                self.labels = json.load(f)
+
+        self.label_ids = {label: idx for idx, label in enumerate(self.labels)}
+
+    def keys(self, texts: list, max_subwords: int, overlap: int) -> list:
+        return [content_hash(f"{max_subwords} {overlap} {text}") for text in texts]
+
+    def get(self, key: str) -> dict:
+        """
+        :return dict: {"entities", "scores", "token_scores"} of the text, as returned by Pipeline.predict_batch
+        """
+        rows = self.store.get(key)
+        scores = rows[:, 1]
+
+        return {
+            "entities": [self.labels[int(label_id)] for label_id in rows[:, 0]],
+            "scores": [float(score) for score in scores[~np.isnan(scores)]],
+            "token_scores": [None if np.isnan(score) else float(score) for score in scores],
+        }
+
+    def add(self, keys: list, tags: list, token_scores: list) -> None:
+        """
+        :param keys: key of each text
+        :param tags: BIO tag of every word of each text
+        :param token_scores: score of every word of each text (None outside entities)
+        """
+        new_keys = []
+        arrays = []
+        for key, text_tags, text_scores in zip(keys, tags, token_scores):
+            # a label outside the dictionary (e.g. a model trained with another scheme) is not cached
+            if key in self.store or any(tag not in self.label_ids for tag in text_tags):
+                continue
+
+            rows = np.empty((len(text_tags), 2), dtype=np.float32)
+            rows[:, 0] = [self.label_ids[tag] for tag in text_tags]
+            rows[:, 1] = [np.nan if score is None else score for score in text_scores]
+
+            new_keys.append(key)
+            arrays.append(rows)
+
+        self.store.add(new_keys, arrays)
@@ -0,0 +1,214 @@
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# directory of the JSONL span files, profiling is off when it is not set
+PROFILE_DIR_ENV = "NER_PROFILE_DIR"
+# "1" also records torch profiler traces of the spans that ask for them
+TORCH_PROFILE_ENV = "NER_TORCH_PROFILE"
+# training steps skipped, warmed up and traced by step_trace_plugin
+TRACE_STEPS = {"wait": 5, "warmup": 1, "active": 3}
+
+
+def rss_mb() -> float:
+    # resident set size right now (Linux), 0 where /proc is not available
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def peak_rss_mb() -> float:
+    # high-water mark of the process (ru_maxrss is in KB on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Profiler:
+    """
+    Timed spans written as JSON lines, one file per run:
+
+    {"run", "pid", "thread", "span", "parent", "start", "seconds", "items",
+     "items_per_second", "rss_mb", "peak_rss_mb", ...extra fields}
+
+    Spans nest per thread (parent is the enclosing span). peak_rss_mb is the
+    process high-water mark when the span ends.
+    """
+
+    def __init__(self, output_dir: str = None, torch_profile: bool = False, run: str = None) -> None:
+        self.output_dir = output_dir
+        self.enabled = output_dir is not None
+        self.torch_profile = torch_profile and self.enabled
+        self.run = run if run is not None else time.strftime("%Y%m%d-%H%M%S")
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._traces = 0
+
+        if self.enabled:
+            os.makedirs(output_dir, exist_ok=True)
+            self.path = f"{output_dir}/{self.run}.jsonl"
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.environ.get(PROFILE_DIR_ENV), os.environ.get(TORCH_PROFILE_ENV) == "1")
+
+    def _stack(self) -> list:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def start(self, name: str, **fields) -> dict:
+        """
+        Opens a span, closed by end(). Use span() unless the start and the end are in different calls (e.g. hooks).
+        """
+        stack = self._stack()
+        record = {"span": name, "parent": stack[-1]["span"] if stack else None, **fields}
+        record["_start"] = time.perf_counter()
+        record["start"] = time.time()
+        stack.append(record)
+
+        return record
+
+    def end(self, record: dict, items: int = None) -> None:
+        seconds = time.perf_counter() - record.pop("_start")
+
+        stack = self._stack()
+        for idx in range(len(stack) - 1, -1, -1):
+            if stack[idx] is record:
+                del stack[idx]
+                break
+
+        if items is not None:
+            record["items"] = items
+        if record.get("items") is not None:
+            record["items_per_second"] = record["items"] / seconds if seconds > 0 else None
+
+        rss = rss_mb()
+        record.update({"run": self.run, "pid": os.getpid(), "thread": threading.current_thread().name, "seconds": seconds, "rss_mb": rss, "peak_rss_mb": max(rss, peak_rss_mb())})
+
+        # one write per line, lines of concurrent threads and worker processes do not mix
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def _torch_trace(self, name: str, **kwargs):
+        import torch
+
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+
+        return torch.profiler.profile(activities=activities, **kwargs)
+
+    @contextmanager
+    def span(self, name: str, items: int = None, profile_torch: bool = False, **fields):
+        """
+        :param name: stage name
+        :param items: number of items processed (sentences, texts, ...), also settable on the yielded record
+        :param profile_torch: record a torch profiler trace of the span (only with NER_TORCH_PROFILE=1)
+        :yield dict: the span record, extra fields can be added to it
+        """
+        if not self.enabled:
+            yield {}
+            return
+
+        record = self.start(name, items=items, **fields)
+        trace = self._torch_trace(name) if profile_torch and self.torch_profile else nullcontext()
+
+        try:
+            with trace:
+                yield record
+        finally:
+            if not isinstance(trace, nullcontext):
+                with self._lock:
+                    self._traces += 1
+                    record["trace"] = f"{self.output_dir}/{self.run}-{os.getpid()}-{name}-{self._traces}.json"
+                trace.export_chrome_trace(record["trace"])
+
+            self.end(record)
+
+    def epoch_plugin(self, name: str = "epoch", items: int = None):
+        """
+        :return TrainerPlugin: flair trainer plugin recording a span per training epoch (None when profiling is off)
+        """
+        if not self.enabled:
+            return None
+
+        from flair.trainers.plugins import TrainerPlugin
+
+        profiler = self
+
+        class EpochSpans(TrainerPlugin):
+            record = None
+
+            @TrainerPlugin.hook
+            def before_training_epoch(self, epoch, **kw):
+                self.record = profiler.start(name, epoch=epoch, items=items)
+
+            @TrainerPlugin.hook
+            def after_training_epoch(self, epoch, **kw):
+                if self.record is not None:
+                    profiler.end(self.record)
+                    self.record = None
+
+        return EpochSpans()
+
+
+    def step_trace_plugin(self, name: str = "train_steps", wait: int = TRACE_STEPS["wait"], warmup: int = TRACE_STEPS["warmup"], active: int = TRACE_STEPS["active"]):
+        """
+        :return TrainerPlugin: flair trainer plugin recording a torch profiler trace of a few training steps (None unless NER_TORCH_PROFILE=1)
+        """
+        if not self.torch_profile:
+            return None
+
+        import torch
+        from flair.trainers.plugins import TrainerPlugin
+
+        profiler = self
+
+        def export(trace):
+            with profiler._lock:
+                profiler._traces += 1
+                trace_file = f"{profiler.output_dir}/{profiler.run}-{os.getpid()}-{name}-{profiler._traces}.json"
+            trace.export_chrome_trace(trace_file)
+
+        class StepTrace(TrainerPlugin):
+            trace = None
+            steps = 0
+
+            def stop(self):
+                if self.trace is not None:
+                    self.trace.stop()
+                    self.trace = None
+
+            @TrainerPlugin.hook
+            def after_setup(self, **kw):
+                # one window of the first epoch, the trace of the whole training would be huge
+                self.trace = profiler._torch_trace(name, schedule=torch.profiler.schedule(wait=wait, warmup=warmup, active=active, repeat=1), on_trace_ready=export)
+                self.trace.start()
+
+            @TrainerPlugin.hook
+            def after_training_batch(self, **kw):
+                if self.trace is not None:
+                    self.trace.step()
+                    self.steps += 1
+                    if self.steps >= wait + warmup + active:
+                        self.stop()
+
+            @TrainerPlugin.hook("after_training_loop", "_training_finally")
+            def finish(self, **kw):
+                self.stop()
+
+        return StepTrace()
+
+
+# process-wide profiler, configured from the environment
+profiler = Profiler.from_env()
+
+
+def span(name: str, items: int = None, profile_torch: bool = False, **fields):
+    return profiler.span(name, items=items, profile_torch=profile_torch, **fields)
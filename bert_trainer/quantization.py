@@ -0,0 +1,71 @@
+import os
+from os import path
+
+import torch
+from flair.embeddings.base import load_embeddings
+from flair.models import SequenceTagger
+
+from vector_store import file_hash
+
+
+def quantize_model(model: torch.nn.Module) -> torch.nn.Module:
+    # weights are quantized once, activations on the fly (dynamic quantization)
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_tagger(tagger: SequenceTagger, copy: bool = True) -> SequenceTagger:
+    """
+    :param tagger: fp32 tagger, left untouched unless copy is False
+    :param copy: False to quantize the tagger itself (e.g. one just loaded from disk)
+    :return SequenceTagger: tagger whose transformer linear layers run in int8 (CPU only)
+    """
+    if copy:
+        # copied through its flair state, the transformer embeddings can not be deepcopied or pickled whole
+        tagger = SequenceTagger.load(tagger._get_state_dict())
+
+    tagger = tagger.cpu()
+    tagger.eval()
+
+    # the tagger head stays in fp32
+    tagger.embeddings.model = quantize_model(tagger.embeddings.model)
+
+    return tagger
+
+
+def quantized_file(model_file: str) -> str:
+    return f"{model_file}.int8.pt"
+
+
+def load_quantized(model_file: str) -> SequenceTagger:
+    """
+    :param model_file: fp32 model saved by flair
+    :return SequenceTagger: int8 tagger, quantized once and read back from disk while the content of model_file does not change
+    """
+    cache_file = quantized_file(model_file)
+    source = file_hash(model_file)
+
+    if path.exists(cache_file):
+        state = torch.load(cache_file, map_location="cpu", weights_only=False)
+
+        if state.get("source_sha1") == source:
+            # the transformer is built from the saved config (no fp32 weights are read) and quantized before the int8 weights are loaded
+            embeddings = load_embeddings(state["embeddings"])
+            embeddings.model = quantize_model(embeddings.model)
+            state["embeddings"] = embeddings
+
+            tagger = SequenceTagger.load(state).cpu()
+            tagger.eval()
+            return tagger
+
+    print("Quantizing:", model_file)
+    tagger = quantize_tagger(SequenceTagger.load(model_file), copy=False)
+
+    # flair state of the int8 tagger: config, tokenizer, tag dictionary and quantized weights
+    state = tagger._get_state_dict()
+    state["source_sha1"] = source
+
+    # write then rename, a reader never sees a half written file
+    torch.save(state, f"{cache_file}.{os.getpid()}.tmp")
+    os.replace(f"{cache_file}.{os.getpid()}.tmp", cache_file)
+
+    return tagger
@@ -5,14 +5,23 @@ from flert import Training
 #from model import Training
 #from transformers import pipeline
 from flert_pipeline import Pipeline
-
-from configs import SBERT, SEED, SENTENCE_THRESHOLD, TERM_THRESHOLD, HISTOGRAM, LINEAR, FIXED
+from model_cache import register_tagger, clear as clear_taggers
+from corpus_store import CorpusStore, write_conll
+from unlabeled_pool import UnlabeledPool
+from columnar_corpus import ColumnarCorpus
+from ann_index import IVFIndex, ids_hash
+from near_duplicates import NearDuplicates, propagate_tags
+from profiling import span
+
+from configs import CENTROID, SBERT, SEED, SENTENCE_THRESHOLD, TERM_THRESHOLD, HISTOGRAM, LINEAR, FIXED, WARM_START_TRAIN_FILE
 from transformers import AutoTokenizer, AutoModelForTokenClassification
 from datasets import Dataset
 from tqdm import tqdm
 from transformers.pipelines.pt_utils import KeyDataset
 import time
 import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import os
 from os import path
 from copy import deepcopy
@@ -24,6 +33,35 @@ import sys
 sys.stderr = sys.stdout
 
 
+def linear_threshold(iteration):
+    return 1 - 0.005*(iteration+1)
+
+
+def histogram_threshold(scores, threshold, min_size, bins=100):
+    '''
+    Lowest histogram bin edge that admits at least min_size sentences (threshold if none does)
+    '''
+    values, indexes = np.histogram(scores, bins=bins)
+    values = values[::-1]
+    indexes = indexes[::-1]
+
+    sum_values = 0
+    end = -1
+
+    for idx, value in enumerate(values):
+        sum_values += value
+        
+        if sum_values >= min_size:
+            end = idx
+            break
+
+    if end > -1:
+        return indexes[end]
+
+    #Otherwise, use the standard
+    return threshold
+
+
 class SelfLearning:
 
     def __init__(self, input: str, output: str, 
@@ -32,13 +70,34 @@ class SelfLearning:
                  labeled_corpus_path: str, unlabeled_corpus_path: str, 
                  sentence_embedding_name: str,
                  model_checkpoint: str, model_name: str,
-                 corpus_name: str) -> None:
+                 corpus_name: str, predict_batch_size: int = 32,
+                 embedding_cache_dir: str = None, label_with_trained_model: bool = False,
+                 feature_cache_dir: str = None, columnar_unlabeled: bool = False,
+                 warm_start: bool = False, warm_start_epochs: int = 3, replay_ratio: float = 1.0,
+                 prefetch_candidates: bool = False, prediction_cache_dir: str = None,
+                 quantized_labeling: bool = False, dissimilarity_mode: str = CENTROID,
+                 ann_index_dir: str = None, dedup_dir: str = None, dedup_threshold: float = 0.8,
+                 dedup_workers: int = 1, propagate_duplicates: bool = True, legacy_sampling: bool = False) -> None:
         
         self.percent_sampling_random = percent_sampling_random
         self.min_size_random = min_size_random
         self.percent_sampling_dissimilar = percent_sampling_dissimilar
         self.min_size_dissimilar = min_size_dissimilar
         self.sentence_embedding_name = sentence_embedding_name
+        self.predict_batch_size = predict_batch_size
+        self.embedding_cache_dir = embedding_cache_dir
+        self.label_with_trained_model = label_with_trained_model
+        self.feature_cache_dir = feature_cache_dir
+        self.warm_start = warm_start
+        self.warm_start_epochs = warm_start_epochs
+        self.replay_ratio = replay_ratio
+        self.prefetch_candidates = prefetch_candidates
+        self.prediction_cache_dir = prediction_cache_dir
+        self.quantized_labeling = quantized_labeling
+        self.dissimilarity_mode = dissimilarity_mode
+        self.ann_index_dir = ann_index_dir
+        self.ann_index = None
+        self.propagate_duplicates = propagate_duplicates
 
         self.input = input
         self.output = output
@@ -47,16 +106,34 @@ class SelfLearning:
         self.labeled_corpus = deepcopy(self.original_labeled_corpus)
 
 
-        with open(unlabeled_corpus_path, 'r') as f:
-            unlabeled_data = json.load(f)
+        with span("unlabeled_load", columnar=columnar_unlabeled) as record:
+            if columnar_unlabeled:
+                #Converted once next to the JSON, every process maps the same files
+                corpus = ColumnarCorpus(unlabeled_corpus_path, text_column="sentences")
+
+                #Sentences still available to sampling, without the ones with one word
+                self.unlabeled_pool = UnlabeledPool.from_columnar(corpus, min_tokens=2, legacy_sampling=legacy_sampling)
+            else:
+                with open(unlabeled_corpus_path, 'r') as f:
+                    unlabeled_data = json.load(f)
+
+                unlabeled_corpus = pd.DataFrame(unlabeled_data)
+                unlabeled_corpus["id"] = unlabeled_corpus.index
 
-        self.unlabeled_corpus = pd.DataFrame(unlabeled_data)
-        self.unlabeled_corpus["id"] = self.unlabeled_corpus.index
+                #Remove sentences with one word
+                count = unlabeled_corpus['sentences'].str.split().str.len()
+                unlabeled_corpus = unlabeled_corpus[~(count<=1)].copy()
 
+                #Sentences still available to sampling (consumed ones are only flagged)
+                self.unlabeled_pool = UnlabeledPool(unlabeled_corpus, legacy_sampling=legacy_sampling)
+            record["items"] = len(self.unlabeled_pool)
 
-        #Remove sentences with one word
-        count = self.unlabeled_corpus['sentences'].str.split().str.len()
-        self.unlabeled_corpus = self.unlabeled_corpus[~(count<=1)].copy()
+        #Near-duplicate clusters of the pool: only one sentence of each is sampled, encoded and labeled
+        self.near_duplicates = None
+        if dedup_dir is not None:
+            self.near_duplicates = self.load_near_duplicates(dedup_dir, dedup_threshold, dedup_workers)
+            self.unlabeled_pool.remove(self.near_duplicates.duplicate_ids())
+            print("Unlabeled sentences after removing near-duplicates:", len(self.unlabeled_pool))
 
         self.model_checkpoint = model_checkpoint
         self.model_name = model_name
@@ -72,27 +149,6 @@ class SelfLearning:
         self.use_rnn = use_rnn
         self.main_evaluation_metric = main_evaluation_metric
 
-    def pandas2txt(self, df, data_folder, output_dir_list):
-        #To train
-        with open(f"{data_folder}/train.txt", "w", encoding="utf-8") as f_out:
-            for _, line in df.iterrows():
-                for txt, tag in zip(line["tokens"], line["ner_tokens"]):
-                    print("{} {}".format(txt, tag), file=f_out)
-                print(file=f_out)
-
-        #To analyse
-        self._create_directory("generated_corpora")
-        output_dir = deepcopy(output_dir_list)
-        output_dir.insert(0, "generated_corpora")
-
-        path = self._create_directory_recursive(".", output_dir)
-
-        with open(f"{path}/train.txt", "w", encoding="utf-8") as f_out:
-            for _, line in df.iterrows():
-                for txt, tag in zip(line["tokens"], line["ner_tokens"]):
-                    print("{} {}".format(txt, tag), file=f_out)
-                print(file=f_out)
-
     def stop_iterations(self, actual_iteration: int, max_iterations: int, f1_patience: int, iteration_f1_without_increase: int) -> bool:
         """
         :param actual_iteration: number of the actual iteration
@@ -102,7 +158,7 @@ class SelfLearning:
         if actual_iteration == max_iterations:
             return True
         
-        if self.unlabeled_corpus.size == 0:
+        if len(self.unlabeled_pool) == 0:
             return True
         
         if iteration_f1_without_increase >= f1_patience:
@@ -145,11 +201,11 @@ class SelfLearning:
 
         return bio_tags
     
-    def threshold_filter_term(self, entities: list, scores: list, threshold: float):
+    def threshold_filter_term(self, entities: list, token_scores: list, threshold: float):
         '''
-        Threshold applied in each term
+        Threshold applied in each term (token_scores has one score per word, None outside entities)
         '''
-        return [entity if score >= threshold else "O" for entity, score in zip(entities, scores)]
+        return [entity if score is not None and score >= threshold else "O" for entity, score in zip(entities, token_scores)]
     
     def threshold_filter_sentence(self, entities: dict, score: float, threshold: float):
         '''
@@ -169,13 +225,13 @@ class SelfLearning:
         else:
             return 0
             
-    def sampling_annotation_instance(self, entities: dict, scores: list, threshold: float, threshold_level: int):
+    def sampling_annotation_instance(self, entities: dict, scores: list, threshold: float, threshold_level: int, token_scores: list = None):
         #Threshold filter
         if threshold_level == SENTENCE_THRESHOLD:
             score_mean = self.get_scores_sentence(scores)
             entities_filtered = self.threshold_filter_sentence(entities, score_mean, threshold)
         elif threshold_level == TERM_THRESHOLD:
-            entities_filtered = self.threshold_filter_term(entities, scores, threshold)
+            entities_filtered = self.threshold_filter_term(entities, token_scores, threshold)
         
         #BIO annotation
         if entities_filtered == []:
@@ -193,68 +249,69 @@ class SelfLearning:
             return threshold
         
     def linear_threshold(self, iteration):
-        return 1 - 0.005*(iteration+1)
+        return linear_threshold(iteration)
 
     def histogram_threshold(self, scores, threshold, bins=100):
-        values, indexes = np.histogram(scores, bins=bins)
-        values = values[::-1]
-        indexes = indexes[::-1]
-
-        sum_values = 0
-        end = -1
+        return histogram_threshold(scores, threshold, self.min_size_dissimilar, bins)
 
-        for idx, value in enumerate(values):
-            sum_values += value
-            
-            if sum_values >= self.min_size_dissimilar:
-                end = idx
-                break
-
-        if end > -1:
-            return indexes[end]
+    def sample_candidates(self, sampling: active_sampling, plus_seed: int) -> pd.DataFrame:
+        with span("sampling", items=len(self.unlabeled_pool), seed=SEED+plus_seed):
+            if self.ann_index is not None:
+                #Least similar sentences of the whole pool, no random prefilter
+                return sampling.index_dissimilarity(self.ann_index, self.labeled_corpus, self.unlabeled_pool, self.percent_sampling_random, self.percent_sampling_dissimilar, self.min_size_random, self.min_size_dissimilar)
 
-        #Otherwise, use the standard
-        return threshold
+            return sampling.random_dissimilarity(self.labeled_corpus, self.unlabeled_pool, self.input, SEED+plus_seed, self.percent_sampling_random, self.percent_sampling_dissimilar, self.min_size_random, self.min_size_dissimilar, self.dissimilarity_mode)
 
-    def apply_sampling_annotation(self, sample_patience: int, machine_annotated: pd.DataFrame, sampling: active_sampling, model_checkpoint: str, threshold: float, threshold_level: int, threshold_function: str, iteration: int):
+    def apply_sampling_annotation(self, sample_patience: int, machine_annotated: pd.DataFrame, sampling: active_sampling, model_checkpoint: str, threshold: float, threshold_level: int, threshold_function: str, iteration: int, tagger=None, candidates=None):
         def filter(tokens):
             return tokens != ['O'] * len(tokens)
         
+        #Instance model (once for every retry)
+        pipe = Pipeline(model_checkpoint, tagger=tagger, prediction_cache_dir=self.prediction_cache_dir, quantized=self.quantized_labeling)
+
         for plus_seed in range(sample_patience):
             #Getting examples
             print("Sampling...")
-            machine_annotated = sampling.random_dissimilarity(self.labeled_corpus, self.unlabeled_corpus, self.input, SEED+plus_seed, self.percent_sampling_random, self.percent_sampling_dissimilar, self.min_size_random, self.min_size_dissimilar)
-
-            #Instance model
-            pipe = Pipeline(model_checkpoint)
+            if plus_seed == 0 and candidates is not None:
+                #Sampled and embedded in the background while the model was training
+                machine_annotated = candidates.result()
+            else:
+                machine_annotated = self.sample_candidates(sampling, plus_seed)
             
+            #Sentences rejected below are not sampled again by the ANN index in this run
+            if self.ann_index is not None:
+                self.ann_index.mark_attempted(machine_annotated["id"])
+
             #Getting predictions
             print("Geting predicitions...")
-            dataset = Dataset.from_pandas(machine_annotated)
             
             #Computing scores
-            entities_scores = [pipe.get_prediction(sentence) for idx, sentence in enumerate(tqdm(KeyDataset(dataset, "sentences")))]
+            with span("ner_labeling", items=len(machine_annotated), quantized=self.quantized_labeling, profile_torch=True):
+                entities_scores = pipe.predict_batch(machine_annotated["sentences"].tolist(), batch_size=self.predict_batch_size)
             entities_list = [entities["entities"] for entities in entities_scores]
 
             scores = [entities["scores"] for entities in entities_scores]
+            token_scores = [entities["token_scores"] for entities in entities_scores]
             #scores_numeric = [score for score in scores if score is not None]
 
             #Getting threshold by histogram
             threshold_dynamic = self.get_threshold(scores, threshold, threshold_function, iteration)
             print("==========> threshold_dynamic:", threshold_dynamic)
 
-            predictions = [self.sampling_annotation_instance(entities, score, threshold_dynamic, threshold_level) for entities, score in zip(entities_list, scores)]
+            predictions = [self.sampling_annotation_instance(entities, score, threshold_dynamic, threshold_level, token_score) for entities, score, token_score in zip(entities_list, scores, token_scores)]
             machine_annotated["ner_tokens"] = predictions
 
             #Remove instances that only have "O"
             machine_annotated = machine_annotated[machine_annotated['ner_tokens'].apply(lambda x: filter(x))]
 
             #Tokenize sentence
-            machine_annotated["tokens"] = [sentence.split(" ") for sentence in machine_annotated["sentences"].values]
+            machine_annotated["tokens"] = [sentence.split() for sentence in machine_annotated["sentences"].values]
 
             #Remove the machine annotated sentences of the unlabeled corpus
             ids_to_remove = machine_annotated['id']
-            self.unlabeled_corpus = self.unlabeled_corpus[~self.unlabeled_corpus['id'].isin(ids_to_remove)]
+            self.unlabeled_pool.remove(ids_to_remove)
+            if self.ann_index is not None:
+                self.ann_index.mark_labeled(ids_to_remove)
             
             #Check if any example was annotated
             if len(machine_annotated) == 0:
@@ -264,6 +321,92 @@ class SelfLearning:
         
         return machine_annotated
     
+    def load_near_duplicates(self, root: str, threshold: float, workers: int, block_size: int = 10000) -> NearDuplicates:
+        pool = self.unlabeled_pool
+
+        def blocks():
+            for start in range(0, len(pool.ids), block_size):
+                frame = pool.frame(np.arange(start, min(start + block_size, len(pool.ids))))
+                yield frame["id"].to_numpy(), frame[self.input].tolist()
+
+        #Ids and texts of the pool, a changed sentence means new clusters
+        sha1 = hashlib.sha1()
+        for ids, texts in blocks():
+            for sentence_id, text in zip(ids.tolist(), texts):
+                sha1.update(f"{sentence_id}\t{text}\n".encode("utf-8"))
+        meta = {**NearDuplicates.parameters(threshold, seed=SEED), "texts_sha1": sha1.hexdigest()}
+
+        #Clustered once per corpus and parameters, the next runs read them back
+        clusters = NearDuplicates.load(root)
+        if clusters is not None and all(clusters.meta.get(key) == value for key, value in meta.items()):
+            return clusters
+
+        print("Clustering near-duplicates...")
+        with span("dedup", items=len(pool.ids), workers=workers):
+            clusters = NearDuplicates.build(blocks(), threshold=threshold, workers=workers, seed=SEED)
+        clusters.meta["texts_sha1"] = meta["texts_sha1"]
+        clusters.save(root)
+
+        return clusters
+
+    def add_duplicates(self, machine_annotated: pd.DataFrame) -> pd.DataFrame:
+        """
+        :return pd.DataFrame: machine_annotated plus the near-duplicates of its sentences, tagged by aligning them with the labeled sentence
+        """
+        source_of = {}
+        for row, sentence_id in enumerate(machine_annotated["id"]):
+            for member in self.near_duplicates.members(sentence_id)[1:]:
+                source_of[int(member)] = row
+
+        if not source_of:
+            return machine_annotated
+
+        with span("propagate_duplicates", items=len(source_of)):
+            duplicates = self.unlabeled_pool.frame(self.unlabeled_pool.positions(list(source_of)))
+
+            tokens = machine_annotated["tokens"].tolist()
+            tags = machine_annotated["ner_tokens"].tolist()
+            duplicates["tokens"] = [sentence.split() for sentence in duplicates[self.input].values]
+            duplicates["ner_tokens"] = [propagate_tags(tokens[source_of[int(sentence_id)]], tags[source_of[int(sentence_id)]], duplicate_tokens)
+                                        for sentence_id, duplicate_tokens in zip(duplicates["id"], duplicates["tokens"])]
+
+            #Remove instances that only have "O"
+            duplicates = duplicates[duplicates["ner_tokens"].apply(lambda x: x != ["O"] * len(x))]
+
+        print("Near-duplicates labeled by propagation:", len(duplicates))
+        return pd.concat([machine_annotated, duplicates], ignore_index=True)
+
+    def load_ann_index(self, sampling: active_sampling) -> IVFIndex:
+        pool = self.unlabeled_pool.to_frame()
+        ids = pool["id"].to_numpy()
+
+        #One index per embedding model and set of unlabeled ids, shared by the runs (folds) that have the same pool
+        root = "{root}/{model}-{ids}".format(root=self.ann_index_dir, model=self.sentence_embedding_name.replace("/", "__"), ids=ids_hash(ids)[:16])
+        index = IVFIndex(root)
+
+        with span("ann_index", items=len(pool)):
+            if not index.matches(self.sentence_embedding_name, ids):
+                print("Building ANN index...")
+                data, rows = sampling.embedding_rows(pool[self.input].tolist())
+
+                #Built aside and renamed into place, readers never see a half built index
+                tmp_root = f"{root}.{os.getpid()}.tmp"
+                index = IVFIndex.build(tmp_root, data, rows, ids, seed=SEED, model=self.sentence_embedding_name)
+                try:
+                    os.rename(tmp_root, root)
+                    index = IVFIndex(root)
+                except OSError:
+                    #Another run got there first (or root is an unusable leftover: this run keeps its own copy)
+                    if IVFIndex(root).matches(self.sentence_embedding_name, ids):
+                        shutil.rmtree(tmp_root, ignore_errors=True)
+                        index = IVFIndex(root)
+
+            #The labeled set of this run is kept in memory
+            data, rows = sampling.embedding_rows(self.labeled_corpus[self.input].tolist())
+            index.reset(data, rows)
+
+        return index
+
     def _create_directory(self, ref):
         if path.exists(ref) == False:
             os.mkdir(ref)
@@ -294,8 +437,28 @@ class SelfLearning:
         best_f1 = 0 #todo
         iteration_f1_without_increase = 0
 
-        sampling = active_sampling(self.sentence_embedding_name)
+        sampling = active_sampling(self.sentence_embedding_name, cache_dir=self.embedding_cache_dir)
+
+        #Embedding the unlabeled corpus once per model, the next iterations (and folds) read from the cache
+        if sampling.cache is not None:
+            print("Caching unlabeled embeddings...")
+            sampling.cache_embeddings(self.unlabeled_pool.to_frame()[self.input].tolist())
+
+        #ANN index of the unlabeled embeddings, built once and reset to the labeled corpus of this run
+        if self.ann_index_dir is not None:
+            self.ann_index = self.load_ann_index(sampling)
+
         model_checkpoint = self.model_checkpoint
+        #Model of the previous iteration to continue from (warm start)
+        base_model = None
+
+        #Background worker for the candidates of the next labeling step
+        prefetcher = ThreadPoolExecutor(max_workers=1) if self.prefetch_candidates else None
+
+        #Append-only store of the training set: the original corpus plus one segment per iteration
+        run_dir_list = output_dir_list + [threshold_level, threshold_function, str(threshold), f"random_{self.percent_sampling_random}"]
+        corpus_store = CorpusStore(self._create_directory_recursive(".", ["generated_corpora"] + run_dir_list + ["segments"]))
+        corpus_store.reset(self.labeled_corpus)
         
         '''#########################################################################
         actual_iteration = 0
@@ -332,12 +495,25 @@ class SelfLearning:
             output_dir_list = output_dir_list + [threshold_level, threshold_function, str(threshold), f"random_{self.percent_sampling_random}", str(actual_iteration)]
             machine_annotated = pd.DataFrame({self.input: [], self.output: []})
 
+            #The candidates only depend on the labeled corpus and the unlabeled pool, both fixed until the labeling step
+            candidates = prefetcher.submit(self.sample_candidates, sampling, 0) if prefetcher is not None else None
+
+            #Taggers of the previous iteration are not used again, free them before the next model is trained
+            training = tagger = None
+            clear_taggers()
+
             #Training model
             print("Training...")
             print("Begin -------->", self.labeled_corpus.columns.values, len(self.labeled_corpus.index), len(self.labeled_corpus.ner_tokens.values))
             #training = Training(data_folder, self.corpus_name, model_checkpoint, self.model_name, max_length, padding, truncation, lr, batch_size, num_epochs, weight_decay, output_dir_list, self.labeled_corpus, model_layer=model_layer)
-            training = Training(data_folder, self.corpus_name, model_checkpoint, self.model_name, output_dir_list)
-            training.train(self.max_length, self.truncation, self.lr, self.num_epochs, self.use_crf, self.use_rnn, self.main_evaluation_metric)
+            if base_model is not None:
+                #Warm start: the new sentences plus a replay sample, for a few epochs
+                print("Warm start from", base_model)
+                training = Training(data_folder, self.corpus_name, model_checkpoint, self.model_name, output_dir_list, feature_cache_dir=self.feature_cache_dir, train_file=WARM_START_TRAIN_FILE)
+                training.train(self.max_length, self.truncation, self.lr, self.warm_start_epochs, self.use_crf, self.use_rnn, self.main_evaluation_metric, base_model=base_model)
+            else:
+                training = Training(data_folder, self.corpus_name, model_checkpoint, self.model_name, output_dir_list, feature_cache_dir=self.feature_cache_dir)
+                training.train(self.max_length, self.truncation, self.lr, self.num_epochs, self.use_crf, self.use_rnn, self.main_evaluation_metric)
 
             print("Saving metrics...")
             y_probs, metrics = training.get_and_save_metrics_test()
@@ -364,29 +540,57 @@ class SelfLearning:
 
             #Labeling
             print("Labeling...")
-            machine_annotated = self.apply_sampling_annotation(sample_patience, machine_annotated, sampling, trained_checkpoint, threshold, threshold_level, threshold_function, actual_iteration)
+            tagger = None
+            if self.label_with_trained_model:
+                #Same weights as the default path (final-model.pt), without building the model again
+                tagger = training.final_tagger()
+                register_tagger(trained_checkpoint, tagger)
+
+            machine_annotated = self.apply_sampling_annotation(sample_patience, machine_annotated, sampling, trained_checkpoint, threshold, threshold_level, threshold_function, actual_iteration, tagger, candidates)
             print(machine_annotated)
 
             #Check if don't have any machine annotated sentence
             if len(machine_annotated) == 0:
                 break
+
+            #Near-duplicates of the labeled sentences reuse their labels (no encoding or NER pass)
+            if self.near_duplicates is not None and self.propagate_duplicates:
+                machine_annotated = self.add_duplicates(machine_annotated)
             
             #Concat labeled corpus and machine annotated
             print("Merging machine annotated examples...")
             print("Labeled corpus -------->",  len(self.labeled_corpus.ner_tokens.values))
             print("Machine annotated -------->", machine_annotated.columns.values, len(machine_annotated.index), len(machine_annotated.ner_tokens.values))
-            self.labeled_corpus = pd.concat([self.labeled_corpus, machine_annotated], ignore_index=True)
 
-            #Pandas df to txt
-            self.pandas2txt(self.labeled_corpus, data_folder, output_dir_list)
+            with span("merge", items=len(machine_annotated)):
+                if self.warm_start:
+                    #Next model continues from this one, trained on the delta and a replay sample of the corpus labeled so far
+                    replay_size = min(len(self.labeled_corpus), int(self.replay_ratio * len(machine_annotated)))
+                    replay = self.labeled_corpus.sample(n=replay_size, random_state=SEED+actual_iteration)
+                    write_conll(pd.concat([machine_annotated, replay], ignore_index=True), f"{data_folder}/{WARM_START_TRAIN_FILE}")
+
+                    base_model = f"{trained_checkpoint}/best-model.pt"
+                    if not path.exists(base_model):
+                        base_model = f"{trained_checkpoint}/final-model.pt"
+
+                self.labeled_corpus = pd.concat([self.labeled_corpus, machine_annotated], ignore_index=True)
+
+            #Only the new sentences are written, train.txt is brought up to date by appending them
+            with span("corpus_write", items=len(machine_annotated)):
+                corpus_store.append(machine_annotated, actual_iteration)
+                corpus_store.assemble(f"{data_folder}/train.txt")
 
             print("Labeled corpus + Machine annotated -------->", self.labeled_corpus.columns.values, len(self.labeled_corpus.index), len(self.labeled_corpus.ner_tokens.values))
 
-            #Saving new training set
+            #Saving the segments that make up the new training set
             generated_dir = deepcopy(output_dir_list)
             generated_dir.insert(0, "generated_corpora")
-            self.save_json(".", generated_dir, self.labeled_corpus.to_json(orient="records"), "train.json")
+            with span("manifest_write"):
+                corpus_store.save_manifest(self._create_directory_recursive(".", generated_dir))
         
+        if prefetcher is not None:
+            prefetcher.shutdown(wait=True, cancel_futures=True)
+
         print("--- %s seconds ---" % (time.time() - start_time))
 
         return output_dir_list
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+
+class UnlabeledPool:
+    """
+    Unlabeled sentences as a fixed array of ids plus a boolean availability
+    bitmap. Removing k sentences costs O(k log N) and drawing n of them
+    costs O(n) while most of the pool is still available, instead of
+    copying the whole DataFrame on every change.
+
+    The fast draws are not the ones DataFrame.sample made for the same
+    seed; legacy_sampling=True reproduces those (in O(N) per draw).
+    """
+
+    def __init__(self, df: pd.DataFrame, id_column: str = "id", legacy_sampling: bool = False) -> None:
+        self.df = df
+        self.corpus = None
+        self.legacy_sampling = legacy_sampling
+        self._index(df[id_column].to_numpy())
+
+    @classmethod
+    def from_columnar(cls, corpus, min_tokens: int = 2, legacy_sampling: bool = False):
+        """
+        :param corpus: ColumnarCorpus, rows are read from its memory map on demand
+        :param min_tokens: sentences with fewer tokens are left out of the pool
+        """
+        pool = cls.__new__(cls)
+        pool.df = None
+        pool.corpus = corpus
+        pool.legacy_sampling = legacy_sampling
+        # the id of a row of a ColumnarCorpus is its position
+        pool._index(np.flatnonzero(np.asarray(corpus.num_tokens) >= min_tokens))
+
+        return pool
+
+    def _index(self, ids: np.ndarray) -> None:
+        self.ids = ids
+
+        # ids are looked up by binary search
+        self.order = np.argsort(self.ids, kind="stable")
+        self.sorted_ids = self.ids[self.order]
+
+        self.available = np.ones(len(self.ids), dtype=bool)
+        self.n_available = len(self.ids)
+
+    def __len__(self) -> int:
+        return self.n_available
+
+    def positions(self, ids) -> np.ndarray:
+        ids = np.asarray(ids, dtype=self.sorted_ids.dtype)
+        idx = np.searchsorted(self.sorted_ids, ids)
+
+        # unknown ids are ignored
+        found = (idx < len(self.sorted_ids)) & (self.sorted_ids[np.minimum(idx, len(self.sorted_ids) - 1)] == ids)
+
+        return self.order[idx[found]]
+
+    def remove(self, ids) -> None:
+        positions = np.unique(self.positions(ids))
+        self.n_available -= int(self.available[positions].sum())
+        self.available[positions] = False
+
+    def sample_positions(self, n: int, seed: int) -> np.ndarray:
+        """
+        :return np.ndarray: n distinct available positions, drawn uniformly
+        """
+        n = min(n, self.n_available)
+
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        if self.legacy_sampling:
+            # the rows DataFrame.sample(n, random_state=seed) drew from the DataFrame of the available sentences
+            return np.flatnonzero(self.available)[np.random.RandomState(seed).permutation(self.n_available)[:n]]
+
+        rng = np.random.default_rng(seed)
+
+        # dense pool: rejection sampling, the cost depends on n and not on the pool size
+        if 2 * n <= self.n_available and 2 * self.n_available >= len(self.available):
+            chosen = []
+            missing = n
+
+            while missing > 0:
+                candidates = rng.integers(0, len(self.available), size=2 * missing)
+                candidates = candidates[self.available[candidates]]
+
+                # keep the first draw of each position
+                _, first = np.unique(candidates, return_index=True)
+                candidates = candidates[np.sort(first)][:missing]
+
+                # taken positions are hidden until the draw is over
+                self.available[candidates] = False
+                chosen.append(candidates)
+                missing -= len(candidates)
+
+            chosen = np.concatenate(chosen)
+            self.available[chosen] = True
+
+            return chosen
+
+        # sparse pool: draw from the explicit list of available positions
+        return rng.choice(np.flatnonzero(self.available), size=n, replace=False)
+
+    def frame(self, positions) -> pd.DataFrame:
+        if self.corpus is not None:
+            return self.corpus.frame(self.ids[positions])
+
+        return self.df.iloc[positions].reset_index(drop=True)
+
+    def sample(self, n: int, seed: int) -> pd.DataFrame:
+        return self.frame(self.sample_positions(n, seed))
+
+    def to_frame(self) -> pd.DataFrame:
+        return self.frame(np.flatnonzero(self.available))
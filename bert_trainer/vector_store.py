@@ -0,0 +1,186 @@
+import fcntl
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+from os import path
+
+import numpy as np
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(file_path: str, chunk_size: int = 1 << 24) -> str:
+    """
+    :return str: sha1 of the bytes of the file, read once per version (size and mtime) and kept in file_path.sha1
+    """
+    stat = os.stat(file_path)
+    version = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    hash_path = f"{file_path}.sha1"
+
+    try:
+        with open(hash_path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored["size"] == version["size"] and stored["mtime_ns"] == version["mtime_ns"]:
+            return stored["sha1"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    sha1 = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha1.update(chunk)
+
+    # write then rename, a reader never sees a half written file
+    with open(f"{hash_path}.{os.getpid()}.tmp", "w", encoding="utf-8") as f:
+        json.dump({**version, "sha1": sha1.hexdigest()}, f)
+    os.replace(f"{hash_path}.{os.getpid()}.tmp", hash_path)
+
+    return sha1.hexdigest()
+
+
+class VectorStore:
+    """
+    Append-only on-disk store of fixed-width rows grouped by key.
+
+    root/meta.json  -> {"dim": ..., "dtype": ...}
+    root/keys.txt   -> one "key offset n_rows" line per entry
+    root/data.bin   -> raw rows, read back as a memory-mapped array
+
+    Several processes may append to the same store: writes are serialized
+    with a file lock and every writer first picks up the entries the others
+    appended.
+    """
+
+    def __init__(self, root: str, dim: int = None, dtype: str = "float32", mmap_mode: str = "r") -> None:
+        self.root = root
+        self.mmap_mode = mmap_mode
+        os.makedirs(root, exist_ok=True)
+
+        self.meta_path = f"{root}/meta.json"
+        self.keys_path = f"{root}/keys.txt"
+        self.data_path = f"{root}/data.bin"
+        self.lock_path = f"{root}/.lock"
+
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+
+        if path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+
+            if dim is not None and meta["dim"] != dim:
+                raise ValueError(f"{root} stores rows of dim {meta['dim']}, not {dim}")
+
+            self.dim = meta["dim"]
+            self.dtype = np.dtype(meta["dtype"])
+
+        self.index = {}
+        self.n_rows = 0
+        self._keys_position = 0
+        self._data = None
+
+        self._refresh()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    @contextmanager
+    def _lock(self):
+        with open(self.lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        # read the entries appended since the last refresh (possibly by another process)
+        if not path.exists(self.keys_path):
+            return
+
+        with open(self.keys_path, "r", encoding="utf-8") as f:
+            f.seek(self._keys_position)
+
+            for line in f:
+                if not line.endswith("\n"):
+                    # entry being written by another process
+                    break
+
+                key, offset, n_rows = line.split()
+                self.index[key] = (int(offset), int(n_rows))
+                self.n_rows = max(self.n_rows, int(offset) + int(n_rows))
+                self._keys_position += len(line.encode("utf-8"))
+
+        self._data = None
+
+    def _write_meta(self):
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype.name}, f)
+
+    @property
+    def data(self) -> np.ndarray:
+        if self._data is None:
+            if self.n_rows == 0:
+                return np.zeros((0, self.dim or 0), dtype=self.dtype)
+            self._data = np.memmap(self.data_path, dtype=self.dtype, mode=self.mmap_mode, shape=(self.n_rows, self.dim))
+
+        return self._data
+
+    def get(self, key: str) -> np.ndarray:
+        offset, n_rows = self.index[key]
+        return self.data[offset:offset + n_rows]
+
+    def offsets(self, keys: list) -> np.ndarray:
+        """
+        :param keys: keys whose entries have exactly one row
+        :return np.ndarray: row position of each key, usable to index self.data
+        """
+        return np.fromiter((self.index[key][0] for key in keys), dtype=np.int64, count=len(keys))
+
+    def add(self, keys: list, arrays: list) -> None:
+        """
+        :param keys: keys of the new entries
+        :param arrays: one (n_rows x dim) array per key
+        """
+        if len(keys) == 0:
+            return
+
+        with self._lock():
+            self._refresh()
+
+            if self.dim is None:
+                self.dim = int(np.asarray(arrays[0]).shape[-1])
+
+            if not path.exists(self.meta_path):
+                self._write_meta()
+
+            row_bytes = self.dim * self.dtype.itemsize
+
+            with open(self.data_path, "ab") as data_file, open(self.keys_path, "a", encoding="utf-8") as keys_file:
+                # drop rows left behind by an interrupted writer
+                data_file.truncate(self.n_rows * row_bytes)
+
+                lines = []
+                for key, array in zip(keys, arrays):
+                    if key in self.index:
+                        continue
+
+                    array = np.ascontiguousarray(np.asarray(array, dtype=self.dtype).reshape(-1, self.dim))
+                    data_file.write(array.tobytes())
+
+                    self.index[key] = (self.n_rows, len(array))
+                    lines.append(f"{key} {self.n_rows} {len(array)}\n")
+                    self.n_rows += len(array)
+
+                data_file.flush()
+                keys_file.write("".join(lines))
+                self._keys_position += sum(len(line.encode("utf-8")) for line in lines)
+
+            self._data = None
+
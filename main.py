@@ -1,9 +1,12 @@
-from bert_trainer.flert import Training
 import sys
 import time
 
+sys.path.append('./bert_trainer')
+
 sys.stderr = sys.stdout
 
+from bert_trainer.fold_scheduler import FoldScheduler
+
 #args
 model_arg = sys.argv[1]
 corpus_name = sys.argv[2]
@@ -62,6 +65,11 @@ technique = "supervised"
 #Number of folds
 folds = 5
 
+#Parallel jobs (optional 4th argument), each one with its share of the CPU threads
+workers = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+
+jobs = []
+
 for use_crf in [True, False]:
     #Output
     architecture = [model_name]
@@ -82,19 +90,22 @@ for use_crf in [True, False]:
         data_folder = f"labeled/corpus/folds/fold"
         output_dir_list = [technique, corpus_name, architecture_str, metric, f"{folds}folds", f"fold{fold}"]
 
-        trainer = Training(data_folder, corpus_name, model_checkpoint, model_name, output_dir_list)
-
-        print("================================")
-        print("Starting training: {model_name}, {model_checkpoint}".format(model_name=model_name, model_checkpoint=model_checkpoint))
-        print("Fold: {fold}/{folds}".format(fold=fold, folds=folds-1))
-        print("================================")
-
-        start_time = time.time()
-        trainer.train(max_length, truncation, lr, num_epochs, use_crf, use_rnn, main_evaluation_metric)
-        y_probs, metrics = trainer.get_and_save_metrics_test()
-        print("--- %s seconds ---" % (time.time() - start_time))
-
-        output_dir = trainer._create_directory_recursive(".", ["time"]+output_dir_list)
-
-        with open(f"{output_dir}/time.txt", "w", encoding="utf-8") as f_out:
-            print("%s seconds" % (time.time() - start_time), file=f_out)
\ No newline at end of file
+        jobs.append({
+            "data_folder": data_folder,
+            "corpus_name": corpus_name,
+            "model_checkpoint": model_checkpoint,
+            "model_name": model_name,
+            "output_dir_list": output_dir_list,
+            #Frozen-transformer features are only reused by the BiLSTM head
+            "training_kwargs": {"feature_cache_dir": "features"} if use_rnn else {},
+            "train_args": (max_length, truncation, lr, num_epochs, use_crf, use_rnn, main_evaluation_metric),
+        })
+
+#Finished jobs are skipped, so running again retries only the failed or killed ones
+failed = FoldScheduler(workers=workers, retries=1).run(jobs)
+
+if failed:
+    print("Failed jobs:")
+    for job in failed:
+        print("\t", "/".join(job["output_dir_list"]))
+    sys.exit(1)
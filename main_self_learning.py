@@ -107,7 +107,12 @@ for use_crf in [True, False]:
                                     labeled_corpus_path=data_folder, unlabeled_corpus_path=data_folder_unlabeled,
                                     sentence_embedding_name="sentence-transformers/distiluse-base-multilingual-cased-v1",
                                     model_checkpoint=model_checkpoint, model_name=model_name,
-                                    corpus_name=corpus_name,)
+                                    corpus_name=corpus_name,
+                                    embedding_cache_dir="embeddings",
+                                    feature_cache_dir="features",
+                                    columnar_unlabeled=True,
+                                    prefetch_candidates=True,
+                                    prediction_cache_dir="predictions")
         
         selfLearning.set_trainer(max_length, truncation, lr, num_epochs, use_crf, use_rnn, main_evaluation_metric)
         
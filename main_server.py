@@ -0,0 +1,31 @@
+import argparse
+import asyncio
+import sys
+
+sys.path.append('./bert_trainer')
+
+sys.stderr = sys.stdout
+
+from bert_trainer.flert_pipeline import Pipeline
+from bert_trainer.inference_server import InferenceServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves a trained model over HTTP, batching concurrent requests.")
+    parser.add_argument("checkpoint", help="model directory with final-model.pt")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=32, help="texts per forward pass")
+    parser.add_argument("--max-wait-ms", type=float, default=10, help="how long the first text of a batch waits for others")
+    parser.add_argument("--quantized", action="store_true", help="int8 linear layers (CPU only), quantized once and cached next to the model")
+    args = parser.parse_args()
+
+    # the checkpoint is loaded once and shared by every request
+    pipe = Pipeline(args.checkpoint, quantized=args.quantized)
+
+    server = InferenceServer(pipe, args.host, args.port, args.max_batch_size, args.max_wait_ms)
+    asyncio.run(server.serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import sys
+from os import path
+
+sys.path.append('./bert_trainer')
+
+sys.stderr = sys.stdout
+
+from bert_trainer.flert_pipeline import Pipeline
+
+
+def load_state(state_file):
+    if not path.exists(state_file):
+        return {"input_offset": 0, "input_line": 0, "output_offset": 0, "tagged": 0}
+
+    with open(state_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state_file, state):
+    # write then rename, an interruption never leaves a half written state
+    with open(f"{state_file}.tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+
+    os.replace(f"{state_file}.tmp", state_file)
+
+
+def input_format(input_file):
+    """
+    :return str: "array" for a .json file holding a JSON array, "jsonl" for JSON lines (.jsonl or any other .json), "text" otherwise
+    """
+    if input_file.endswith(".jsonl"):
+        return "jsonl"
+
+    if not input_file.endswith(".json"):
+        return "text"
+
+    with open(input_file, "rb") as f:
+        for line in iter(f.readline, b""):
+            line = line.strip()
+            if line:
+                return "array" if line.startswith(b"[") else "jsonl"
+
+    return "jsonl"
+
+
+def check_record(record, field, where):
+    if not isinstance(record, dict) or not isinstance(record.get(field), str):
+        raise ValueError("{where}: expected an object with a text field '{field}', got {record}".format(where=where, field=field, record=json.dumps(record, ensure_ascii=False)[:200]))
+
+    return record
+
+
+def read_blocks(input_file, offset, line_number, block_size, input_format, field):
+    """
+    Yields (records, offset after the block, line or index after the block) with
+    at most block_size records. The offset is a byte offset of the input file,
+    or the index of the next record of a JSON array.
+    """
+    if input_format == "array":
+        # a JSON array is read whole, the saved offset is a record index
+        with open(input_file, "r", encoding="utf-8") as f:
+            records = json.load(f)
+
+        if not isinstance(records, list):
+            raise ValueError("{input_file}: expected a JSON array of objects".format(input_file=input_file))
+
+        for start in range(offset, len(records), block_size):
+            end = min(start + block_size, len(records))
+            yield [check_record(records[idx], field, "{input_file}, index {idx}".format(input_file=input_file, idx=idx)) for idx in range(start, end)], end, end
+
+        yield [], len(records), len(records)
+        return
+
+    with open(input_file, "rb") as f:
+        f.seek(offset)
+        records = []
+
+        for line in iter(f.readline, b""):
+            line_number += 1
+            line = line.decode("utf-8").strip()
+
+            if line:
+                if input_format == "jsonl":
+                    where = "{input_file}, line {line_number}".format(input_file=input_file, line_number=line_number)
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError as error:
+                        raise ValueError("{where}: invalid JSON ({error})".format(where=where, error=error)) from error
+                    records.append(check_record(record, field, where))
+                else:
+                    records.append({field: line})
+
+            if len(records) == block_size:
+                yield records, f.tell(), line_number
+                records = []
+
+        yield records, f.tell(), line_number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tags a JSONL (one object per line), JSON array or plain text (one text per line) file of any size.")
+    parser.add_argument("checkpoint", help="model directory with final-model.pt")
+    parser.add_argument("input", help="input file (.jsonl for JSON lines, .json for a JSON array or JSON lines, anything else is read as plain text)")
+    parser.add_argument("output", help="tagged JSONL output, appended to when resuming")
+    parser.add_argument("--field", default="sentences", help="text field of the JSON records")
+    parser.add_argument("--batch-size", type=int, default=32, help="sentences per forward pass")
+    parser.add_argument("--block-size", type=int, default=1024, help="records held in memory at a time")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved offset and tag from the beginning")
+    parser.add_argument("--quantized", action="store_true", help="int8 linear layers (CPU only), quantized once and cached next to the model")
+    args = parser.parse_args()
+
+    fmt = input_format(args.input)
+    state_file = f"{args.output}.state"
+
+    state = load_state(state_file) if not args.restart else {"input_offset": 0, "input_line": 0, "output_offset": 0, "tagged": 0}
+    if state["input_offset"] > 0:
+        print("Resuming at {unit} {offset} ({tagged} records already tagged)".format(unit="record" if fmt == "array" else "byte", offset=state["input_offset"], tagged=state["tagged"]))
+
+    pipe = Pipeline(args.checkpoint, quantized=args.quantized)
+
+    with open(args.output, "ab") as f_out:
+        # drop records written after the last saved state
+        f_out.truncate(state["output_offset"])
+
+        for records, input_offset, input_line in read_blocks(args.input, state["input_offset"], state.get("input_line", 0), args.block_size, fmt, args.field):
+            texts = [record[args.field] for record in records]
+            predictions = pipe.predict_batch(texts, batch_size=args.batch_size)
+
+            for record, text, prediction in zip(records, texts, predictions):
+                record["tokens"] = text.split()
+                record["ner_tokens"] = prediction["entities"]
+                record["scores"] = prediction["scores"]
+                f_out.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+
+            f_out.flush()
+            os.fsync(f_out.fileno())
+
+            state = {"input_offset": input_offset, "input_line": input_line, "output_offset": f_out.tell(), "tagged": state["tagged"] + len(records)}
+            save_state(state_file, state)
+            print("Tagged: {tagged}".format(tagged=state["tagged"]))
+
+
+if __name__ == "__main__":
+    main()
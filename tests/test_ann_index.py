@@ -0,0 +1,60 @@
+import sys
+from os import path
+
+import numpy as np
+
+sys.path.append(path.join(path.dirname(path.dirname(path.abspath(__file__))), "bert_trainer"))
+
+from ann_index import IVFIndex
+
+
+def clustered(rng, n, dim=16, clusters=8):
+    centers = rng.normal(size=(clusters, dim))
+    return (centers[rng.integers(clusters, size=n)] + 0.1 * rng.normal(size=(n, dim))).astype(np.float32), centers
+
+
+def test_rejected_sentences_are_not_sampled_again(tmp_path):
+    rng = np.random.default_rng(0)
+    data, centers = clustered(rng, 400)
+    ids = np.arange(1000, 1400, dtype=np.int64)
+
+    index = IVFIndex.build(str(tmp_path / "index"), data, ids=ids, nlist=8, model="test")
+    # the labeled corpus sits on one cluster, the least similar sentences are elsewhere
+    index.reset(centers[:1].astype(np.float32))
+
+    offered = []
+    for _ in range(10):
+        # every sampled sentence is rejected by the labeling threshold (none is labeled)
+        sample, _ = index.least_similar(25)
+        if len(sample) == 0:
+            break
+
+        assert not np.isin(sample, np.concatenate(offered) if offered else []).any()
+        offered.append(sample)
+        index.mark_attempted(sample)
+
+    # ten samples of 25 distinct sentences, never the same outliers again
+    assert len(offered) == 10
+    assert len(np.unique(np.concatenate(offered))) == 250
+
+
+def test_pool_runs_out_once_everything_was_attempted(tmp_path):
+    rng = np.random.default_rng(1)
+    data, centers = clustered(rng, 60)
+
+    index = IVFIndex.build(str(tmp_path / "index"), data, nlist=4)
+    index.reset(centers[:1].astype(np.float32))
+
+    accepted, _ = index.least_similar(10)
+    index.mark_attempted(accepted)
+    index.mark_labeled(accepted)
+
+    rejected, _ = index.least_similar(50)
+    index.mark_attempted(rejected)
+
+    assert len(rejected) == 50
+    assert len(index.least_similar(10)[0]) == 0
+
+    # a new run offers every unlabeled sentence again
+    index.reset(centers[:1].astype(np.float32))
+    assert len(index.least_similar(60)[0]) == 60
@@ -0,0 +1,66 @@
+import math
+import random
+import sys
+from os import path
+
+import pytest
+
+sys.path.append(path.join(path.dirname(path.dirname(path.abspath(__file__))), "bert_trainer"))
+
+seqeval_metrics = pytest.importorskip("seqeval.metrics")
+
+from metrics import classification_report, read_flair_tsv, report_from_ids
+
+# well formed BIO, other schemes and malformed labels (seqeval still reads them)
+LABELS = ["O", "B-PER", "I-PER", "B-LOC", "I-LOC", "B-ORG-X", "I-ORG-X", "E-PER", "S-LOC", "B", "I", ".", "PER", "I-MISC"]
+
+
+def random_sentences(rng, n_sentences, max_length, labels):
+    return [[rng.choice(labels) for _ in range(rng.randint(1, max_length))] for _ in range(n_sentences)]
+
+
+def random_case(rng, labels):
+    y_true = random_sentences(rng, rng.randint(1, 20), 15, labels)
+    # predictions are mostly the gold labels, with some noise
+    y_pred = [[label if rng.random() < 0.7 else rng.choice(labels) for label in sentence] for sentence in y_true]
+
+    return y_true, y_pred
+
+
+def same(a, b):
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(same(a[key], b[key]) for key in a)
+
+    a, b = float(a), float(b)
+
+    return a == b or (math.isnan(a) and math.isnan(b))
+
+
+def seqeval_report(y_true, y_pred):
+    return seqeval_metrics.classification_report(y_true, y_pred, digits=4, output_dict=True, zero_division=0)
+
+
+@pytest.mark.parametrize("labels", [LABELS[:5], LABELS], ids=["bio", "mixed"])
+@pytest.mark.parametrize("seed", range(10))
+def test_classification_report_matches_seqeval(seed, labels):
+    rng = random.Random(seed)
+
+    for _ in range(100):
+        y_true, y_pred = random_case(rng, labels)
+        assert same(seqeval_report(y_true, y_pred), classification_report(y_true, y_pred)), (y_true, y_pred)
+
+
+def test_flair_tsv_matches_seqeval(tmp_path):
+    rng = random.Random(0)
+    y_true, y_pred = random_case(rng, LABELS[:5])
+
+    # token, gold and predicted label per line, a blank line after each sentence
+    with open(tmp_path / "test.tsv", "w", encoding="utf-8") as f_out:
+        for gold, pred in zip(y_true, y_pred):
+            f_out.write("".join(f"word {true_label} {pred_label}\n" for true_label, pred_label in zip(gold, pred)))
+            f_out.write("\n")
+
+    vocabulary = {}
+    true_ids, pred_ids = read_flair_tsv(str(tmp_path / "test.tsv"), vocabulary)
+
+    assert same(seqeval_report(y_true, y_pred), report_from_ids(true_ids, pred_ids, list(vocabulary)))
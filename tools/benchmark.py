@@ -0,0 +1,299 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import time
+from os import path
+
+# the benchmarks run inside the work directory, the repository is added with absolute paths
+REPO = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.append(REPO)
+sys.path.append(f"{REPO}/bert_trainer")
+sys.path.append(f"{REPO}/tools")
+
+import numpy as np
+
+from synthetic_corpus import build_tagger, build_tiny_bert, build_tiny_sbert, make_sentence, write_corpus
+
+BENCHMARKS = ["metrics", "corpus_write", "corpus_read", "columnar_sampling", "cosine_scoring", "dissimilarity", "inference", "self_learning_iteration"]
+
+
+def measure(function, repeat: int) -> dict:
+    """
+    :param function: benchmark body, returns the number of items it processed
+    :return dict: median and min seconds of the runs, items and items/s (from the median)
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = function()
+        seconds.append(time.perf_counter() - start)
+
+    median = statistics.median(seconds)
+
+    return {"seconds": median, "min_seconds": min(seconds), "repeat": repeat, "items": items, "items_per_second": items / median if median > 0 else None}
+
+
+class Suite:
+    """
+    Hot paths of training, labeling and sampling on a synthetic corpus and
+    tiny randomly initialized models, built in workdir without network access.
+    """
+
+    def __init__(self, workdir: str, labeled: int, unlabeled: int, seed: int) -> None:
+        self.workdir = path.abspath(workdir)
+        self.seed = seed
+
+        shutil.rmtree(self.workdir, ignore_errors=True)
+        os.makedirs(self.workdir)
+
+        self.corpus = write_corpus(f"{self.workdir}/corpus", labeled, unlabeled, seed)
+        self._models = None
+
+    def models(self) -> dict:
+        # only the benchmarks that need torch build the models
+        if self._models is None:
+            bert_dir = build_tiny_bert(f"{self.workdir}/models/bert", seed=self.seed)
+            self._models = {
+                "bert": bert_dir,
+                "sbert": build_tiny_sbert(bert_dir, f"{self.workdir}/models/sbert"),
+                "tagger": build_tagger(bert_dir, f"{self.workdir}/models/tagger"),
+            }
+
+        return self._models
+
+    def labeled_frame(self):
+        from txt2df import create_dataframe_from_txt
+
+        return create_dataframe_from_txt(self.corpus["labeled"], file="train.txt")
+
+    def unlabeled_texts(self) -> list:
+        with open(self.corpus["unlabeled"], "r", encoding="utf-8") as f:
+            return [record["sentences"] for record in json.load(f)]
+
+    def metrics(self, repeat):
+        from metrics import classification_report
+
+        # gold labels against a copy with a tenth of the words wrong
+        rng = np.random.default_rng(self.seed)
+        gold = [make_sentence(rng)[1] for _ in range(20000)]
+        pred = [[tag if rng.random() > 0.1 else "O" for tag in tags] for tags in gold]
+
+        def run():
+            classification_report(gold, pred)
+            return sum(len(tags) for tags in gold)
+
+        return measure(run, repeat)
+
+    def corpus_write(self, repeat):
+        from corpus_store import CorpusStore
+
+        df = self.labeled_frame()
+        chunks = np.array_split(np.arange(len(df)), 10)
+
+        def run():
+            # segment 0 plus ten appends, train.txt brought up to date after each one
+            store = CorpusStore(f"{self.workdir}/corpus_write/segments")
+            store.reset(df.iloc[chunks[0]])
+            for iteration, chunk in enumerate(chunks[1:]):
+                store.append(df.iloc[chunk], iteration)
+                store.assemble(f"{self.workdir}/corpus_write/train.txt")
+            return len(df)
+
+        return measure(run, repeat)
+
+    def corpus_read(self, repeat):
+        from flert import Training
+
+        def run():
+            # the train, dev and test splits as Training loads them (ColumnCorpus), no model is built
+            corpus = Training(self.corpus["labeled"], "synthetic", None, None, []).corpus
+            return sum(len(split) for split in [corpus.train, corpus.dev, corpus.test] if split is not None)
+
+        return measure(run, repeat)
+
+    def columnar_sampling(self, repeat):
+        from columnar_corpus import ColumnarCorpus
+        from unlabeled_pool import UnlabeledPool
+
+        def run():
+            # conversion, pool and one random sample of a tenth of the corpus
+            shutil.rmtree(f"{self.corpus['unlabeled']}.columnar", ignore_errors=True)
+            pool = UnlabeledPool.from_columnar(ColumnarCorpus(self.corpus["unlabeled"], text_column="sentences"), min_tokens=2)
+            sample = pool.sample(max(1, len(pool) // 10), self.seed)
+            pool.remove(sample["id"])
+            return self.corpus["unlabeled_sentences"]
+
+        return measure(run, repeat)
+
+    def cosine_scoring(self, repeat):
+        import torch
+        from active_sampling import active_sampling
+        from configs import CENTROID
+
+        sampling = active_sampling(self.models()["sbert"])
+
+        # scoring only, on random embeddings of the size of the corpus
+        generator = torch.Generator().manual_seed(self.seed)
+        candidates = torch.randn(self.corpus["unlabeled_sentences"], 768, generator=generator)
+        target = torch.randn(self.corpus["sentences"]["train.txt"], 768, generator=generator)
+
+        return measure(lambda: len(sampling.average_similarity(candidates, target, CENTROID)), repeat)
+
+    def dissimilarity(self, repeat):
+        import pandas as pd
+        from active_sampling import active_sampling
+
+        sampling = active_sampling(self.models()["sbert"])
+        target = self.labeled_frame()
+        candidates = pd.DataFrame({"sentences": self.unlabeled_texts()})
+
+        def run():
+            # encoding of both sets and scoring, half of the candidates kept
+            sampling.dissimilarity(target, candidates, 0.5, 1, "sentences")
+            return len(candidates)
+
+        return measure(run, repeat)
+
+    def inference(self, repeat):
+        from flert_pipeline import Pipeline
+
+        pipe = Pipeline(self.models()["tagger"])
+        texts = self.unlabeled_texts()
+
+        # the first batch pays for lazy initialisation
+        pipe.predict_batch(texts[:32], batch_size=32)
+
+        return measure(lambda: len(pipe.predict_batch(texts, batch_size=32)), repeat)
+
+    def self_learning_iteration(self, repeat):
+        from configs import FIXED, SENTENCE_THRESHOLD
+        from self_learning import SelfLearning
+
+        models = self.models()
+
+        def run():
+            # train (1 epoch), evaluate, sample, label and merge once, on a fresh copy of the corpus
+            run_dir = f"{self.workdir}/self_learning"
+            shutil.rmtree(run_dir, ignore_errors=True)
+            shutil.copytree(self.corpus["labeled"], f"{run_dir}/labeled")
+
+            cwd = os.getcwd()
+            os.chdir(run_dir)
+            try:
+                learning = SelfLearning(input="sentences", output="ner_tokens",
+                                        percent_sampling_random=0.1, percent_sampling_dissimilar=0.5,
+                                        min_size_random=1, min_size_dissimilar=1,
+                                        labeled_corpus_path="labeled", unlabeled_corpus_path=self.corpus["unlabeled"],
+                                        sentence_embedding_name=models["sbert"],
+                                        model_checkpoint=models["bert"], model_name="tiny-bert",
+                                        corpus_name="synthetic", label_with_trained_model=True)
+                learning.set_trainer(512, True, 5e-05, 1, False, False, ("micro avg", "f1-score"))
+                learning.iterations("labeled", 1, 1, 0.0, SENTENCE_THRESHOLD, 0.005, 4, FIXED, 1, 0, ["benchmark"])
+            finally:
+                os.chdir(cwd)
+
+            return self.corpus["sentences"]["train.txt"]
+
+        return measure(run, repeat)
+
+
+def run(args):
+    if args.threads is not None:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    suite = Suite(args.workdir, args.labeled, args.unlabeled, args.seed)
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        # a full iteration trains a model, it is timed once
+        repeat = 1 if name == "self_learning_iteration" else args.repeat
+        print(f"Running {name}...")
+        results[name] = getattr(suite, name)(repeat)
+        print("\t{seconds:.4f} s, {rate}".format(seconds=results[name]["seconds"],
+              rate="{:.1f} items/s".format(results[name]["items_per_second"]) if results[name]["items_per_second"] else "-"))
+
+    meta = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "labeled": args.labeled,
+        "unlabeled": args.unlabeled,
+        "seed": args.seed,
+        "threads": args.threads,
+    }
+
+    with open(args.output, "w", encoding="utf-8") as f_out:
+        json.dump({"meta": meta, "results": results}, f_out, indent=2)
+
+
+def compare(args) -> int:
+    """
+    :return int: 1 if any benchmark is slower than the baseline by more than the tolerance, else 0
+    """
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, "r", encoding="utf-8") as f:
+        current = json.load(f)
+
+    for key in ["labeled", "unlabeled", "seed"]:
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"Warning: {key} differs ({baseline['meta'].get(key)} vs {current['meta'].get(key)}), the timings are not comparable")
+
+    regressions = []
+    print("{:<26}{:>12}{:>12}{:>9}".format("benchmark", "baseline s", "current s", "ratio"))
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            print(f"{name:<26}{'-':>12}{result['seconds']:>12.4f}{'new':>9}")
+            continue
+
+        ratio = result["seconds"] / baseline["results"][name]["seconds"] if baseline["results"][name]["seconds"] > 0 else float("inf")
+        flag = ""
+        if ratio > 1 + args.tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - args.tolerance:
+            flag = "  faster"
+
+        print(f"{name:<26}{baseline['results'][name]['seconds']:>12.4f}{result['seconds']:>12.4f}{ratio:>9.2f}{flag}")
+
+    if regressions:
+        print("Regressions (> {:.0%} slower): {}".format(args.tolerance, ", ".join(regressions)))
+        return 1
+
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the hot paths on a synthetic corpus and tiny local models, and compares runs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="runs the benchmarks and writes their results as JSON")
+    run_parser.add_argument("--workdir", default="benchmark_workdir", help="directory for the corpus, models and outputs (recreated)")
+    run_parser.add_argument("--labeled", type=int, default=1000, help="labeled sentences of the synthetic corpus")
+    run_parser.add_argument("--unlabeled", type=int, default=10000, help="unlabeled sentences of the synthetic corpus")
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, the median is reported")
+    run_parser.add_argument("--threads", type=int, help="torch CPU threads")
+    run_parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="benchmarks to run (all by default)")
+    run_parser.add_argument("--output", default="benchmark.json")
+
+    compare_parser = commands.add_parser("compare", help="flags the benchmarks slower than a stored baseline")
+    compare_parser.add_argument("baseline", help="results of the reference run")
+    compare_parser.add_argument("current", help="results of the run to check")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown (0.1 = 10%%)")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import argparse
+
+import pandas as pd
+
+
+def summarize(records: pd.DataFrame) -> pd.DataFrame:
+    """
+    :param records: spans of one or more runs, as written by profiling.Profiler
+    :return pd.DataFrame: calls, total and mean seconds, share of the run time, items/s and peak RSS of every span name
+    """
+    if "items" not in records:
+        records["items"] = None
+
+    summary = records.groupby("span").agg(
+        calls=("seconds", "size"),
+        seconds=("seconds", "sum"),
+        mean_seconds=("seconds", "mean"),
+        items=("items", "sum"),
+        peak_rss_mb=("peak_rss_mb", "max"),
+    )
+    summary["items_per_second"] = (summary["items"] / summary["seconds"]).where(summary["items"] > 0)
+
+    # share of the time of the top level spans (nested spans are part of their parent's time)
+    top_level = records.loc[records["parent"].isna(), "seconds"].sum()
+    summary["share"] = summary["seconds"] / top_level if top_level > 0 else None
+
+    return summary.sort_values("seconds", ascending=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarizes the profiling spans of one or more runs (NER_PROFILE_DIR/*.jsonl).")
+    parser.add_argument("files", nargs="+", help="JSONL files written with NER_PROFILE_DIR set")
+    parser.add_argument("--output", help="CSV file for the summary")
+    args = parser.parse_args()
+
+    records = pd.concat([pd.read_json(file, lines=True) for file in args.files], ignore_index=True)
+    summary = summarize(records)
+
+    print(summary.to_string(float_format=lambda value: f"{value:.3f}"))
+
+    if args.output is not None:
+        summary.to_csv(args.output)
+
+
+if __name__ == "__main__":
+    main()
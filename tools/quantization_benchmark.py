@@ -0,0 +1,76 @@
+import argparse
+import json
+import sys
+import time
+
+sys.path.append('./bert_trainer')
+
+import torch
+
+from flert_pipeline import Pipeline
+from metrics import classification_report
+from threshold_simulator import read_conll
+
+
+def run(pipe, texts, batch_size):
+    start = time.perf_counter()
+    predictions = pipe.predict_batch(texts, batch_size=batch_size)
+
+    return [prediction["entities"] for prediction in predictions], time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the fp32 and the int8 quantized Pipeline on the test sets of the folds.")
+    parser.add_argument("--fold", nargs=2, action="append", required=True, metavar=("MODEL_DIR", "TEST_FILE"), help="model directory and its test.txt (repeat for every fold)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, help="torch CPU threads")
+    parser.add_argument("--output", help="JSON file for the results")
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    results = []
+    for model_dir, test_file in args.fold:
+        sentences = read_conll(test_file)
+        texts = [" ".join(tokens) for tokens, _ in sentences]
+        gold = [tags for _, tags in sentences]
+
+        fold = {"model": model_dir, "test": test_file, "sentences": len(texts)}
+        for name, quantized in [("fp32", False), ("int8", True)]:
+            pipe = Pipeline(model_dir, quantized=quantized)
+
+            # the first batch pays for lazy initialisation
+            pipe.predict_batch(texts[:args.batch_size], batch_size=args.batch_size)
+
+            predictions, seconds = run(pipe, texts, args.batch_size)
+            report = classification_report(gold, predictions)
+
+            fold[name] = {
+                "seconds": seconds,
+                "sentences_per_second": len(texts) / seconds if seconds > 0 else 0,
+                "micro_f1": report["micro avg"]["f1-score"],
+                "macro_f1": report["macro avg"]["f1-score"],
+            }
+
+        fold["speedup"] = fold["fp32"]["seconds"] / fold["int8"]["seconds"] if fold["int8"]["seconds"] > 0 else 0
+        fold["micro_f1_delta"] = fold["int8"]["micro_f1"] - fold["fp32"]["micro_f1"]
+        fold["macro_f1_delta"] = fold["int8"]["macro_f1"] - fold["fp32"]["macro_f1"]
+        results.append(fold)
+
+        print("{model}: {speedup:.2f}x faster, micro F1 {micro:+.4f}, macro F1 {macro:+.4f} ({fp32:.1f} -> {int8:.1f} sentences/s)".format(
+            model=model_dir, speedup=fold["speedup"], micro=fold["micro_f1_delta"], macro=fold["macro_f1_delta"],
+            fp32=fold["fp32"]["sentences_per_second"], int8=fold["int8"]["sentences_per_second"]))
+
+    if len(results) > 1:
+        mean = lambda key: sum(fold[key] for fold in results) / len(results)
+        print("Mean over {n} folds: {speedup:.2f}x faster, micro F1 {micro:+.4f}, macro F1 {macro:+.4f}".format(
+            n=len(results), speedup=mean("speedup"), micro=mean("micro_f1_delta"), macro=mean("macro_f1_delta")))
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
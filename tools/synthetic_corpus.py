@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+# UlyssesNER-Br categories, with a few surface forms each
+ENTITIES = {
+    "PESSOA": [["João", "Silva"], ["Maria", "das", "Graças"], ["Pedro", "Alves", "Costa"], ["Ana", "Souza"], ["Carlos", "Eduardo", "Lima"]],
+    "ORGANIZACAO": [["Câmara", "dos", "Deputados"], ["Senado", "Federal"], ["Ministério", "da", "Saúde"], ["Supremo", "Tribunal", "Federal"], ["Comissão", "de", "Finanças", "e", "Tributação"]],
+    "LOCAL": [["Brasília"], ["São", "Paulo"], ["Rio", "Grande", "do", "Sul"], ["Amazonas"], ["Distrito", "Federal"]],
+    "DATA": [["1º", "de", "janeiro", "de", "2020"], ["2019"], ["30", "de", "junho"], ["dezembro", "de", "2021"]],
+    "EVENTO": [["Copa", "do", "Mundo"], ["Olimpíadas"], ["Carnaval"], ["Semana", "Nacional", "de", "Trânsito"]],
+    "FUNDAMENTO": [["Lei", "nº", "8.666"], ["art.", "5º", "da", "Constituição"], ["Decreto-Lei", "nº", "2.848"], ["Lei", "Complementar", "nº", "101"]],
+    "PRODUTODELEI": [["Estatuto", "da", "Criança", "e", "do", "Adolescente"], ["Código", "Civil"], ["Marco", "Civil", "da", "Internet"], ["Lei", "de", "Responsabilidade", "Fiscal"]],
+}
+
+WORDS = ("o a os as de do da dos das em no na para por com sem que se sobre entre pelo pela ao à "
+         "projeto requerimento emenda parecer proposta votação sessão audiência relator autor deputado senador "
+         "dispõe altera institui revoga acrescenta regulamenta estabelece determina requer solicita aprova rejeita "
+         "política programa fundo orçamento tributo contribuição benefício servidor município estado união "
+         "educação saúde segurança transporte meio ambiente trabalho previdência assistência cultura esporte "
+         "nacional pública federal municipal estadual social especial geral urgente anual outras providências").split()
+
+
+def make_sentence(rng: np.random.Generator, min_words: int = 6, max_words: int = 40, entity_rate: float = 0.15):
+    """
+    :return tuple: tokens and BIO tags of a random legislative-like sentence
+    """
+    n_words = int(rng.integers(min_words, max_words + 1))
+    types = list(ENTITIES)
+    tokens, tags = [], []
+
+    while len(tokens) < n_words:
+        if rng.random() < entity_rate:
+            entity_type = types[int(rng.integers(len(types)))]
+            forms = ENTITIES[entity_type]
+            form = forms[int(rng.integers(len(forms)))]
+            tokens.extend(form)
+            tags.extend(["B-" + entity_type] + ["I-" + entity_type] * (len(form) - 1))
+        else:
+            tokens.append(WORDS[int(rng.integers(len(WORDS)))])
+            tags.append("O")
+
+    return tokens, tags
+
+
+def write_conll(sentences: list, file_path: str) -> None:
+    with open(file_path, "w", encoding="utf-8") as f_out:
+        for tokens, tags in sentences:
+            f_out.write("".join(f"{token} {tag}\n" for token, tag in zip(tokens, tags)))
+            f_out.write("\n")
+
+
+def write_corpus(root: str, labeled: int = 1000, unlabeled: int = 10000, seed: int = 42) -> dict:
+    """
+    Writes a synthetic corpus in the layout of the real one:
+
+    root/labeled/{train,dev,test}.txt -> CoNLL (80/10/10 split of the labeled sentences)
+    root/unlabeled/corpus.json        -> [{"sentences": "..."}, ...]
+
+    :return dict: paths and sizes of the corpus
+    """
+    rng = np.random.default_rng(seed)
+    labeled_dir = f"{root}/labeled"
+    unlabeled_dir = f"{root}/unlabeled"
+    os.makedirs(labeled_dir, exist_ok=True)
+    os.makedirs(unlabeled_dir, exist_ok=True)
+
+    sentences = [make_sentence(rng) for _ in range(labeled)]
+    n_train = int(0.8 * labeled)
+    n_dev = int(0.1 * labeled)
+    splits = {"train.txt": sentences[:n_train], "dev.txt": sentences[n_train:n_train + n_dev], "test.txt": sentences[n_train + n_dev:]}
+    for file_name, split in splits.items():
+        write_conll(split, f"{labeled_dir}/{file_name}")
+
+    with open(f"{unlabeled_dir}/corpus.json", "w", encoding="utf-8") as f_out:
+        json.dump([{"sentences": " ".join(make_sentence(rng)[0])} for _ in range(unlabeled)], f_out, ensure_ascii=False)
+
+    return {"labeled": labeled_dir, "unlabeled": f"{unlabeled_dir}/corpus.json", "sentences": {name: len(split) for name, split in splits.items()}, "unlabeled_sentences": unlabeled}
+
+
+def vocabulary() -> list:
+    words = set(WORDS)
+    for forms in ENTITIES.values():
+        for form in forms:
+            words.update(form)
+
+    return sorted(words)
+
+
+def build_tiny_bert(model_dir: str, hidden_size: int = 64, layers: int = 2, heads: int = 2, seed: int = 42) -> str:
+    """
+    Randomly initialized BERT with a word-level vocabulary of the synthetic corpus, built offline.
+
+    :return str: model_dir, loadable with from_pretrained / TransformerWordEmbeddings
+    """
+    import torch
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    os.makedirs(model_dir, exist_ok=True)
+    with open(f"{model_dir}/vocab.txt", "w", encoding="utf-8") as f_out:
+        f_out.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + vocabulary()) + "\n")
+
+    tokenizer = BertTokenizerFast(vocab_file=f"{model_dir}/vocab.txt", do_lower_case=False, model_max_length=512)
+    tokenizer.save_pretrained(model_dir)
+
+    torch.manual_seed(seed)
+    config = BertConfig(vocab_size=len(tokenizer), hidden_size=hidden_size, num_hidden_layers=layers, num_attention_heads=heads,
+                        intermediate_size=4 * hidden_size, max_position_embeddings=512)
+    BertModel(config).save_pretrained(model_dir)
+
+    return model_dir
+
+
+def build_tiny_sbert(bert_dir: str, model_dir: str) -> str:
+    """
+    :return str: model_dir, a SentenceTransformer (mean pooling) over the tiny BERT
+    """
+    from sentence_transformers import SentenceTransformer, models
+
+    transformer = models.Transformer(bert_dir)
+    pooling = models.Pooling(transformer.get_word_embedding_dimension(), pooling_mode="mean")
+    SentenceTransformer(modules=[transformer, pooling]).save(model_dir)
+
+    return model_dir
+
+
+def build_tagger(bert_dir: str, model_dir: str, use_crf: bool = False) -> str:
+    """
+    Untrained SequenceTagger over the tiny BERT, predicting BIO spans of the
+    entity types of the synthetic corpus (as a tagger trained by Training does).
+
+    :return str: model_dir, holding final-model.pt
+    """
+    from flair.data import Dictionary
+    from flair.embeddings import TransformerWordEmbeddings
+    from flair.models import SequenceTagger
+
+    # span labels, the tagger expands them to B-/I- tags (like make_label_dictionary on a CoNLL corpus)
+    tag_dictionary = Dictionary(add_unk=False)
+    tag_dictionary.span_labels = True
+    for entity_type in ENTITIES:
+        tag_dictionary.add_item(entity_type)
+
+    embeddings = TransformerWordEmbeddings(model=bert_dir, layers="-1", subtoken_pooling="first", fine_tune=True, use_context=False)
+    tagger = SequenceTagger(hidden_size=64, embeddings=embeddings, tag_dictionary=tag_dictionary, tag_type="ner", tag_format="BIO",
+                            use_crf=use_crf, use_rnn=False, reproject_embeddings=False)
+
+    os.makedirs(model_dir, exist_ok=True)
+    tagger.save(f"{model_dir}/final-model.pt")
+
+    return model_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Writes a synthetic legislative NER corpus and, optionally, tiny randomly initialized models (no network).")
+    parser.add_argument("root", help="output directory")
+    parser.add_argument("--labeled", type=int, default=1000, help="labeled sentences (train/dev/test)")
+    parser.add_argument("--unlabeled", type=int, default=10000, help="unlabeled sentences")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--models", action="store_true", help="also build the tiny BERT, SBERT and tagger under root/models")
+    args = parser.parse_args()
+
+    corpus = write_corpus(args.root, args.labeled, args.unlabeled, args.seed)
+    print(json.dumps(corpus, indent=2))
+
+    if args.models:
+        bert_dir = build_tiny_bert(f"{args.root}/models/bert", seed=args.seed)
+        build_tiny_sbert(bert_dir, f"{args.root}/models/sbert")
+        build_tagger(bert_dir, f"{args.root}/models/tagger")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import argparse
+import sys
+
+sys.path.append('.')
+sys.path.append('./bert_trainer')
+
+import numpy as np
+import pandas as pd
+
+from configs import SENTENCE_THRESHOLD, TERM_THRESHOLD, FIXED, LINEAR, HISTOGRAM
+from metrics import OUTSIDE, encode, get_entities
+from prediction_cache import PredictionCache
+from self_learning import histogram_threshold, linear_threshold
+
+
+def read_conll(file_path):
+    """
+    :return list: (tokens, tags) of every sentence of a CoNLL file (token tag per line, blank line between sentences)
+    """
+    sentences = []
+    tokens, tags = [], []
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2:
+                tokens.append(parts[0])
+                tags.append(parts[-1])
+            elif tokens:
+                sentences.append((tokens, tags))
+                tokens, tags = [], []
+
+    if tokens:
+        sentences.append((tokens, tags))
+
+    return sentences
+
+
+class Simulation:
+    """
+    Stored predictions and gold labels of a set of sentences, flattened as
+    in metrics.encode (an OUTSIDE label after every sentence), with the
+    per-sentence counts every threshold policy is evaluated from.
+    """
+
+    def __init__(self, cache: PredictionCache, keys: list, sentences: list) -> None:
+        rows = [cache.store.get(key) if key in cache.store else None for key in keys]
+        found = [idx for idx, (row, (tokens, _)) in enumerate(zip(rows, sentences)) if row is not None and len(row) == len(tokens)]
+        self.missing = len(sentences) - len(found)
+
+        self.vocabulary = {label: idx for idx, label in enumerate(cache.labels)}
+        self.outside = self.vocabulary[OUTSIDE]
+
+        self.gold = encode([sentences[idx][1] for idx in found], self.vocabulary)
+        self.labels = list(self.vocabulary)
+
+        separator = np.array([[self.outside, np.nan]], dtype=np.float32)
+        predicted = np.concatenate([np.concatenate([rows[idx], separator]) for idx in found]) if found else np.zeros((0, 2), dtype=np.float32)
+        self.pred = predicted[:, 0].astype(np.int32)
+        self.scores = predicted[:, 1].astype(np.float64)
+
+        self.lengths = np.asarray([len(sentences[idx][0]) for idx in found], dtype=np.int64)
+        self.n_sentences = len(found)
+        self.sentence_of = np.repeat(np.arange(self.n_sentences), self.lengths + 1)
+
+        # mean score of the entity words of every sentence (SelfLearning.get_scores_sentence)
+        scored = ~np.isnan(self.scores)
+        sums = np.bincount(self.sentence_of, weights=np.where(scored, self.scores, 0), minlength=self.n_sentences)
+        counts = np.bincount(self.sentence_of, weights=scored, minlength=self.n_sentences)
+        self.sentence_scores = np.divide(sums, counts, out=np.zeros(self.n_sentences), where=counts > 0)
+
+        self.gold_keys, self.gold_per_sentence = self._entities(self.gold)
+
+    def _entities(self, ids):
+        types, begins, ends, _ = get_entities(ids, self.labels)
+        radix = len(ids) + 1
+        keys = (types.astype(np.int64) * radix + begins) * radix + ends
+
+        return keys, np.bincount(self.sentence_of[begins], minlength=self.n_sentences)
+
+    def _counts(self, pred):
+        """
+        :return tuple: predicted entities, true positives and predicted entity words of every sentence
+        """
+        types, begins, ends, _ = get_entities(pred, self.labels)
+        radix = len(pred) + 1
+        keys = (types.astype(np.int64) * radix + begins) * radix + ends
+        sentence = self.sentence_of[begins]
+
+        pred_entities = np.bincount(sentence, minlength=self.n_sentences)
+        tp = np.bincount(sentence[np.isin(keys, self.gold_keys)], minlength=self.n_sentences)
+        tagged = np.bincount(self.sentence_of, weights=pred != self.outside, minlength=self.n_sentences)
+
+        return pred_entities, tp, tagged
+
+    def _rows(self, admitted, pred_entities, tp):
+        """
+        :param admitted: policies x sentences boolean matrix
+        """
+        admitted = admitted.astype(np.int64)
+        sentences = admitted.sum(axis=1)
+        tokens = admitted @ self.lengths
+        predicted = admitted @ pred_entities
+        correct = admitted @ tp
+        gold = admitted @ self.gold_per_sentence
+
+        precision = np.divide(correct, predicted, out=np.zeros(len(admitted)), where=predicted > 0)
+        recall = np.divide(correct, gold, out=np.zeros(len(admitted)), where=gold > 0)
+        f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(len(admitted)), where=(precision + recall) > 0)
+
+        return sentences, tokens, predicted, precision, recall, f1
+
+    def sentence_level(self, thresholds: np.ndarray):
+        # every threshold at once: a sentence is admitted with its mean score, if it has an entity
+        pred_entities, tp, tagged = self._counts(self.pred)
+        admitted = (self.sentence_scores[None, :] >= thresholds[:, None]) & (tagged > 0)[None, :]
+
+        return self._rows(admitted, pred_entities, tp)
+
+    def term_level(self, thresholds: np.ndarray):
+        # words below the threshold become O (SelfLearning.threshold_filter_term), a sentence is admitted if an entity word is left
+        results = []
+        for threshold in thresholds:
+            keep = self.scores >= threshold
+            pred = np.where(keep, self.pred, self.outside)
+            pred_entities, tp, tagged = self._counts(pred)
+            results.append(self._rows((tagged > 0)[None, :], pred_entities, tp))
+
+        return tuple(np.concatenate([result[column] for result in results]) for column in range(6))
+
+
+def policies(args, sentence_scores):
+    """
+    :return list: (function, parameter, effective threshold) of every policy
+    """
+    result = [(FIXED, threshold, threshold) for threshold in args.thresholds]
+    result += [(LINEAR, iteration, linear_threshold(iteration)) for iteration in range(args.iterations)]
+    result += [(HISTOGRAM, threshold, float(histogram_threshold(sentence_scores, threshold, args.min_size, args.bins))) for threshold in args.thresholds]
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluates self-learning threshold policies on stored predictions and gold labels.")
+    parser.add_argument("gold", help="CoNLL file with the gold labels (e.g. the dev.txt of a fold)")
+    parser.add_argument("--cache", default="predictions", help="prediction cache directory")
+    parser.add_argument("--checkpoint", help="model directory, its missing predictions are computed and cached first")
+    parser.add_argument("--fingerprint", help="model fingerprint inside the cache (instead of --checkpoint)")
+    parser.add_argument("--max-subwords", type=int, default=510, help="window settings the predictions were made with (--fingerprint only)")
+    parser.add_argument("--overlap", type=int, default=64)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[round(value, 2) for value in np.arange(0.5, 1.0, 0.01)])
+    parser.add_argument("--iterations", type=int, default=20, help="iterations of the linear threshold")
+    parser.add_argument("--min-size", type=int, default=1000, help="min_size_dissimilar of the histogram threshold")
+    parser.add_argument("--bins", type=int, default=100)
+    parser.add_argument("--output", help="CSV file for the results")
+    args = parser.parse_args()
+
+    sentences = read_conll(args.gold)
+    texts = [" ".join(tokens) for tokens, _ in sentences]
+
+    if args.checkpoint is not None:
+        from flert_pipeline import Pipeline
+
+        pipe = Pipeline(args.checkpoint, prediction_cache_dir=args.cache)
+        pipe.predict_batch(texts, overlap=args.overlap)
+        cache = pipe.predictions
+        keys = cache.keys(texts, pipe.max_subwords(), args.overlap)
+    elif args.fingerprint is not None:
+        cache = PredictionCache(args.cache, fingerprint=args.fingerprint)
+        keys = cache.keys(texts, args.max_subwords, args.overlap)
+    else:
+        parser.error("either --checkpoint or --fingerprint is required")
+
+    simulation = Simulation(cache, keys, sentences)
+    print(f"{simulation.n_sentences} sentences ({simulation.missing} without stored predictions)")
+
+    policy_list = policies(args, simulation.sentence_scores)
+    thresholds = np.asarray([threshold for _, _, threshold in policy_list], dtype=np.float64)
+
+    frames = []
+    for level, evaluate in [(SENTENCE_THRESHOLD, simulation.sentence_level), (TERM_THRESHOLD, simulation.term_level)]:
+        sentences_admitted, tokens, predicted, precision, recall, f1 = evaluate(thresholds)
+        frames.append(pd.DataFrame({
+            "level": level,
+            "function": [function for function, _, _ in policy_list],
+            "parameter": [parameter for _, parameter, _ in policy_list],
+            "threshold": thresholds,
+            "sentences": sentences_admitted,
+            "tokens": tokens,
+            "entities": predicted,
+            "precision": precision,
+            "recall": recall,
+            "f1": f1,
+        }))
+
+    results = pd.concat(frames, ignore_index=True)
+    print(results.to_string(index=False, float_format=lambda value: f"{value:.4f}"))
+
+    if args.output is not None:
+        results.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()